@@ -1,7 +1,18 @@
+import numpy as np
 import pandas as pd
-from storage import load_expenses, load_cars
-import matplotlib.pyplot as plt
+from storage import (sum_expenses_by_category, sum_expenses_by_year, sum_expenses_by_month, load_car,
+                     load_fleet_summary, load_fleet_category_totals)
 import os
+import cache
+import profiling
+from cost_index import get_cost_index
+from exporter import export_expenses
+
+# Наибольшее число точек временного ряда на графике: длинные ряды прореживаются до отрисовки.
+# Панель графиков шириной 700 точек экрана, по минимуму и максимуму на точку - 1400
+MAX_CHART_POINTS = 1400
+# Окно скользящей стоимости километра по умолчанию, км
+COST_CURVE_WINDOW_KM = 10000
 
 def autopct_format(pct, values):
     """
@@ -11,39 +22,212 @@ def autopct_format(pct, values):
     value = int(pct / 100 * total)
     return f'{value} руб.\n({pct:.1f}%)'
 
-def show_expenses_categories(car_id):
+def downsample(x, y, max_points=MAX_CHART_POINTS):
+    """
+    Прореживает ряд до max_points точек: в каждом из max_points / 2 интервалов остаются
+    точки минимума и максимума, поэтому пики на графике сохраняются
+    Возвращает пару массивов NumPy (x, y)
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    if len(y) <= max_points:
+        return x, y
+    buckets = max_points // 2
+    size = -(-len(y) // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:len(y)] = y
+    rows = padded.reshape(buckets, size)
+    # Последний интервал может оказаться целиком заполнен NaN - такие интервалы пропускаем
+    filled = ~np.all(np.isnan(rows), axis=1)
+    offsets = np.arange(buckets)[filled] * size
+    rows = rows[filled]
+    keep = np.unique(np.concatenate((offsets + np.nanargmin(rows, axis=1), offsets + np.nanargmax(rows, axis=1),
+                                     [0, len(y) - 1])))
+    return x[keep], y[keep]
+
+@profiling.timed
+@cache.per_car
+def expenses_by_category(car_id, **filters):
+    """
+    Получает суммы расходов по категориям для выбранного А/М из месячных итогов в БД
+    (по строкам расходов - только при фильтре по пробегу или неполным месяцам).
+    filters - необязательные date_from, date_to, mileage_from, mileage_to.
+    Не обращается к matplotlib, поэтому может выполняться в фоновом потоке
+    """
+    return sum_expenses_by_category(car_id, **filters)
+
+def draw_expenses_categories(ax, sums):
+    """
+    Рисует на осях ax диаграмму расходов по категориям по результату expenses_by_category
+    """
+    amounts = [row['total'] for row in sums]
+    wedges, *_ = ax.pie(amounts, labels=[row['category'] for row in sums], autopct=lambda pct: autopct_format(pct, amounts), startangle=90, radius=0.5)
+    ax.set_title('Затраты по категориям')
+    return wedges
+
+@profiling.timed
+@cache.per_car
+def expenses_by_year(car_id, **filters):
+    """
+    Получает суммы расходов по годам для выбранного А/М из месячных итогов в БД
+    (по строкам расходов - только при фильтре по пробегу или неполным месяцам).
+    filters - необязательные date_from, date_to, mileage_from, mileage_to.
+    Не обращается к matplotlib, поэтому может выполняться в фоновом потоке
+    """
+    return sum_expenses_by_year(car_id, **filters)
+
+def draw_expenses_by_year(ax, sums):
+    """
+    Рисует на осях ax график расходов по годам по результату expenses_by_year
+    """
+    years = [row['year'] for row in sums]
+    bars = ax.bar(years, [row['total'] for row in sums])
+    ax.set_xticks(years)
+    ax.set_title("Расходы на авто по годам")
+    ax.set_xlabel("Год")
+    ax.set_ylabel("Сумма расходов, ₽")
+    return bars
+
+def update_expenses_by_year(ax, bars, sums):
+    """
+    Обновляет высоты столбцов, нарисованных draw_expenses_by_year, если набор лет не изменился
+    Возвращает False, если график нужно нарисовать заново
+    """
+    if [bar.get_x() + bar.get_width() / 2 for bar in bars] != [row['year'] for row in sums]:
+        return False
+    for bar, row in zip(bars, sums):
+        bar.set_height(row['total'])
+    ax.relim()
+    ax.autoscale_view()
+    return True
+
+@profiling.timed
+@cache.per_car
+def monthly_spend(car_id, **filters):
+    """
+    Получает суммы расходов А/М по месяцам из месячных итогов в БД
+    Возвращает пару массивов NumPy (месяцы datetime64[M], суммы)
+    """
+    rows = sum_expenses_by_month(car_id, **filters)
+    months = np.array([row['month'] for row in rows], dtype='datetime64[M]')
+    return downsample(months, [row['total'] for row in rows])
+
+def draw_monthly_spend(ax, series):
     """
-    Формирует диаграмму расходов по категориям для выбранного А/М
+    Рисует на осях ax ступенчатый график расходов по месяцам по результату monthly_spend
     """
-    expenses = load_expenses(car_id, True)
-    df = pd.DataFrame.from_records(expenses, columns=['id', 'car_id', 'amount', 'category', 'date', 'description', 'mileage'])
-    sum = df.groupby('category', as_index=False)['amount'].sum()
-    plt.figure(figsize=(9, 9))
-    plt.pie(sum['amount'], labels=sum['category'], autopct=lambda pct: autopct_format(pct, sum['amount']), startangle=90, radius=0.5)
-    plt.title('Затраты по категориям')
-    plt.show()
+    line, = ax.plot(*series, drawstyle='steps-mid')
+    ax.set_title("Расходы по месяцам")
+    ax.set_ylabel("Сумма расходов, ₽")
+    return line
 
-def show_expenses_by_year(car_id):
+@profiling.timed
+@cache.per_car
+def cost_per_km_curve(car_id, window_km=COST_CURVE_WINDOW_KM):
     """
-    Формирует график расходов по годам для выбранного А/М
+    Скользящая стоимость километра за последние window_km км в точке каждой траты,
+    по индексу накопленных сумм за один проход и с прореживанием до MAX_CHART_POINTS точек
+    Возвращает пару массивов NumPy (пробег, руб/км)
     """
-    expenses = load_expenses(car_id, True)
-    df = pd.DataFrame.from_records(expenses,
-                                   columns=['id', 'car_id', 'amount', 'category', 'date', 'description', 'mileage'])
-    df['Year'] = pd.to_datetime(df['date']).dt.year
-    grouped = df.groupby('Year', as_index=False)['amount'].sum()
-    plt.bar(grouped['Year'], grouped['amount'])
-    plt.xticks(grouped['Year'].to_numpy())
-    plt.title("Расходы на авто по годам")
-    plt.xlabel("Год")
-    plt.ylabel("Сумма расходов, ₽")
-    plt.show()
+    car = load_car(car_id)
+    if car is None:
+        return np.array([]), np.array([])
+    return downsample(*get_cost_index(car).rolling_cost_per_km(window_km))
 
-def export_to_excel(car_id):
+def draw_cost_per_km_curve(ax, series):
+    """
+    Рисует на осях ax кривую стоимости километра по результату cost_per_km_curve
+    """
+    line, = ax.plot(*series)
+    ax.set_title(f"Стоимость километра (окно {COST_CURVE_WINDOW_KM} км)")
+    ax.set_xlabel("Пробег, км")
+    ax.set_ylabel("руб/км")
+    return line
+
+def update_line(ax, line, series):
+    """
+    Заменяет данные линии без пересоздания графика
+    """
+    line.set_data(*series)
+    ax.relim()
+    ax.autoscale_view()
+    return True
+
+def has_data(data):
+    """
+    Проверяет, есть ли что рисовать: строки выборки или пара массивов (x, y)
+    """
+    return len(data[0] if isinstance(data, tuple) else data) > 0
+
+@profiling.timed
+def expenses_frame(batch):
+    """
+    Формирует DataFrame из колоночного ExpenseBatch без промежуточных объектов на каждую строку.
+    Даты переводятся в datetime64 из номеров дней, без разбора строк
+    """
+    columns = batch.to_numpy()
+    df = pd.DataFrame(columns)
+    df['date'] = pd.to_datetime(columns['day'], unit='D')
+    return df
+
+# Графики А/М: название -> (функция данных по ID А/М, функция рисования на осях,
+# функция обновления нарисованного графика или None, размер для сохранения в файл в дюймах)
+CAR_CHARTS = {
+    "categories": (expenses_by_category, draw_expenses_categories, None, (9, 9)),
+    "years": (expenses_by_year, draw_expenses_by_year, update_expenses_by_year, (8, 6)),
+    "monthly": (monthly_spend, draw_monthly_spend, update_line, (10, 5)),
+    "cost_per_km": (cost_per_km_curve, draw_cost_per_km_curve, update_line, (10, 5)),
+}
+
+@profiling.timed
+def render_car_charts(car_id, directory, dpi=100):
+    """
+    Сохраняет графики А/М в PNG-файлы car_<id>_<график>.png в папке directory.
+    Рисует на отдельных Figure без pyplot, поэтому не требует интерактивного окна
+    Возвращает список путей сохранённых файлов
+    """
+    from matplotlib.figure import Figure
+
+    paths = []
+    for name, (data_function, draw_function, _, size) in CAR_CHARTS.items():
+        data = data_function(car_id)
+        if not has_data(data):
+            continue
+        fig = Figure(figsize=size)
+        draw_function(fig.subplots(), data)
+        path = os.path.join(directory, f"car_{car_id}_{name}.png")
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    return paths
+
+FLEET_SUMMARY_COLUMNS = ['car_id', 'model', 'year', 'mileage', 'price', 'total_amount', 'max_mileage',
+                         'expense_count', 'first_date', 'last_date', 'cost_per_km', 'cost_per_year']
+
+@profiling.timed
+def fleet_summary(sort_by='cost_per_km', ascending=False):
+    """
+    Формирует сводку по всему автопарку: затраты, пробег, стоимость километра, затраты в год
+    и доли категорий в затратах (колонки с названиями категорий).
+    Данные берутся двумя сгруппированными запросами, доли считаются векторно без цикла по А/М.
+    Несортированная сводка кешируется до изменения данных любого А/М
+    """
+    summary = cache.cached('fleet_summary', None, _fleet_summary)
+    return summary.sort_values(sort_by, ascending=ascending, na_position='last', ignore_index=True)
+
+def _fleet_summary():
+    summary = pd.DataFrame.from_records(load_fleet_summary(), columns=FLEET_SUMMARY_COLUMNS)
+    # У А/М без трат показатели NULL, приводим к float, чтобы колонки сортировались как числа
+    summary[['cost_per_km', 'cost_per_year']] = summary[['cost_per_km', 'cost_per_year']].astype(float)
+    totals = pd.DataFrame.from_records(load_fleet_category_totals(), columns=['car_id', 'category', 'total'])
+    shares = totals.pivot_table(index='car_id', columns='category', values='total', aggfunc='sum', fill_value=0)
+    shares = shares.div(shares.sum(axis=1), axis=0)
+    return summary.join(shares, on='car_id')
+
+@profiling.timed
+def export_to_excel(car_id, path=None):
+    """
+    Выгружает расходы А/М в excel, по умолчанию в data/expenses.xlsx
+    """
     DATA_DIR = "data"
     EXCEL_FILE = os.path.join(DATA_DIR, "expenses.xlsx")
-    expenses = load_expenses(car_id, True)
-    df = pd.DataFrame.from_records(expenses,
-                                   columns=['id', 'car_id', 'amount', 'category', 'date', 'description', 'mileage'])
-    df.to_excel(EXCEL_FILE, sheet_name='Expenses')
-
+    return export_expenses(path or EXCEL_FILE, [car_id])
@@ -0,0 +1,230 @@
+# benchmarks.py
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+import cache
+import cost_index
+import storage
+from exporter import export_expenses
+from models import Car, Expense
+
+# Размеры синтетического автопарка: (количество А/М, трат на каждый А/М)
+PRESETS = {
+    "small": (10, 1000),
+    "fleet": (1000, 1000),
+    "long": (1, 1000000),
+}
+# Категории и примеры описаний трат каждой категории
+DESCRIPTIONS = {
+    "ТО (тех.обслуживание)": ["Замена масла и фильтров", "Замена тормозных колодок", "Замена свечей зажигания",
+                              "Развал-схождение", "Шиномонтаж", "Замена ремня ГРМ"],
+    "Страховка (КАСКО, ОСАГО)": ["Полис ОСАГО", "Полис КАСКО"],
+    "Топливо": ["АЗС Лукойл АИ-95", "АЗС Газпромнефть АИ-92", "АЗС Роснефть АИ-95"],
+    "Мойки": ["Мойка кузова", "Комплексная мойка", "Химчистка салона"],
+    "Платные парковки": ["Парковка в центре", "Парковка в аэропорту"],
+    "Другое": ["Штраф", "Омывающая жидкость", "Коврики в салон", ""],
+}
+CATEGORIES = list(DESCRIPTIONS)
+# Замер записи: количество трат, сохраняемых по одной через save_expense, и размеры транзакций
+INGEST_ROWS = 1000
+INGEST_BATCH_SIZES = (1, 10, 100, 1000)
+
+def generate_fleet(db_file: str, cars: int, expenses_per_car: int, seed: int = 0):
+    """
+    Создаёт БД с синтетическим автопарком: cars А/М по expenses_per_car трат с растущими пробегом и датой.
+    При одинаковом seed данные воспроизводятся
+    """
+    rng = random.Random(seed)
+    storage.init_storage(db_file)
+    car_ids = []
+    for number in range(cars):
+        car = Car(id=0, model=f"Модель {number}", year=rng.randint(2000, 2020),
+                  mileage=float(rng.randint(0, 100000)), price=float(rng.randint(300000, 3000000)))
+        car_ids.append((storage.save_car(car), car.mileage))
+
+    def expenses():
+        for car_id, mileage in car_ids:
+            day = date(2010, 1, 1)
+            for _ in range(expenses_per_car):
+                mileage += rng.uniform(1, 500)
+                day += timedelta(days=rng.randint(0, 2))
+                category = rng.choice(CATEGORIES)
+                yield {
+                    "car_id": car_id,
+                    "amount": round(rng.uniform(100, 20000), 2),
+                    "date": day.isoformat(),
+                    "category": category,
+                    "description": rng.choice(DESCRIPTIONS[category]),
+                    "mileage": round(mileage, 1),
+                }
+
+    storage.save_expenses(expenses(), chunk_size=10000)
+    return [car_id for car_id, _ in car_ids]
+
+def ingest(car_id: int, rows: int, batch_size: int = None, committer: storage.GroupCommitter = None):
+    """
+    Сохраняет rows трат по одной через save_expense: по batch_size трат в транзакции
+    либо через GroupCommitter, когда он передан
+    """
+    expenses = [Expense(id=0, car_id=car_id, amount=100.0, category="Топливо", date="2025-01-01",
+                        description="АЗС Лукойл АИ-95", mileage=float(mileage)) for mileage in range(rows)]
+    if committer is not None:
+        for future in [committer.submit(storage.save_expense, expense) for expense in expenses]:
+            future.result()
+        return
+    for start in range(0, rows, batch_size):
+        with storage.transaction():
+            for expense in expenses[start:start + batch_size]:
+                storage.save_expense(expense)
+
+def measure(func, repeat: int) -> dict:
+    """
+    Замеряет время выполнения func repeat раз; кеш результатов очищается перед каждым запуском
+    """
+    timings = []
+    for _ in range(repeat):
+        cache.clear()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat}
+
+def run_benchmarks(car_ids: list, repeat: int = 5, tmp_dir: str = None) -> dict:
+    """
+    Замеряет основные операции на текущей БД. Возвращает словарь {название: результат замера}.
+    Если для операции не установлена библиотека, результат содержит причину пропуска
+    """
+    from gui import CarExpensesApp
+
+    # Самый "длинный" А/М - первый: у всех А/М одинаковое количество трат
+    car_id = car_ids[0]
+    cars = storage.load_cars()
+    car = next(car for car in cars if car.id == car_id)
+    car.expenses = storage.load_expenses(car_id)
+    car_without_stats = Car(id=car.id, model=car.model, year=car.year, mileage=car.mileage, price=car.price)
+    car_without_stats.expenses = car.expenses
+    car_with_batch = Car(id=car.id, model=car.model, year=car.year, mileage=car.mileage, price=car.price)
+    car_with_batch.expenses = storage.load_expense_batch(car_id)
+    index = cost_index.CostIndex(car.mileage, car_with_batch.expenses)
+    tmp_dir = tmp_dir or tempfile.gettempdir()
+
+    benchmarks = {
+        "load_cars": storage.load_cars,
+        "load_expenses": lambda: storage.load_expenses(car_id),
+        "load_expenses_page": lambda: storage.load_expenses_page(car_id),
+        "load_expense_batch": lambda: storage.load_expense_batch(car_id),
+        "calculate_expense": car_without_stats.calculate_expense,
+        "calculate_expense_batch": car_with_batch.calculate_expense,
+        "calculate_expense_stats": car.calculate_expense,
+        "cost_index_build": lambda: cost_index.CostIndex(car.mileage, car_with_batch.expenses),
+        "cost_index_window": lambda: index.last_km(20000),
+        "rolling_cost_per_km": lambda: index.rolling_cost_per_km(20000),
+        "tab_refresh_rows": lambda: CarExpensesApp.load_page_rows(car_id, None),
+        "search_expenses": lambda: storage.search_expenses("тормозн колод", car_id),
+        "search_expenses_fleet": lambda: storage.search_expenses("ремень грм"),
+        "export_csv": lambda: export_expenses(os.path.join(tmp_dir, "benchmark.csv"), [car_id]),
+    }
+    results = {}
+    try:
+        import analytics
+        benchmarks.update({
+            "expenses_by_category": lambda: analytics.expenses_by_category(car_id),
+            "expenses_by_year": lambda: analytics.expenses_by_year(car_id),
+            "expenses_frame": lambda: analytics.expenses_frame(car_with_batch.expenses),
+            "fleet_summary": analytics.fleet_summary,
+            "export_to_excel": lambda: analytics.export_to_excel(car_id, os.path.join(tmp_dir, "benchmark.xlsx")),
+        })
+    except ImportError as e:
+        for name in ("expenses_by_category", "expenses_by_year", "expenses_frame", "fleet_summary", "export_to_excel"):
+            results[name] = {"skipped": str(e)}
+
+    # Записи идут в отдельный А/М, который удаляется после замеров, чтобы не менять данные остальных
+    ingest_car_id = storage.save_car(Car(id=0, model="Замер записи", year=2020, mileage=0.0, price=1.0))
+    for batch_size in INGEST_BATCH_SIZES:
+        benchmarks[f"ingest_batch_{batch_size}"] = lambda batch_size=batch_size: ingest(ingest_car_id, INGEST_ROWS, batch_size)
+    committer = storage.GroupCommitter()
+    benchmarks["ingest_group_commit"] = lambda: ingest(ingest_car_id, INGEST_ROWS, committer=committer)
+
+    try:
+        for name, func in benchmarks.items():
+            try:
+                results[name] = measure(func, repeat)
+            except (ImportError, RuntimeError) as e:
+                results[name] = {"skipped": str(e)}
+    finally:
+        committer.close()
+        storage.delete_car(ingest_car_id)
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Сравнивает медианы замеров с предыдущим запуском
+    Возвращает список замедлившихся больше чем на tolerance операций: (название, было, стало)
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name, {})
+        if "median" in result and "median" in previous and result["median"] > previous["median"] * (1 + tolerance):
+            regressions.append((name, previous["median"], result["median"]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности на синтетическом автопарке")
+    parser.add_argument("--preset", choices=PRESETS, default="small", help="размер автопарка")
+    parser.add_argument("--cars", type=int, help="количество А/М (вместо preset)")
+    parser.add_argument("--expenses", type=int, help="трат на каждый А/М (вместо preset)")
+    parser.add_argument("--repeat", type=int, default=5, help="количество повторов каждого замера")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="файл для результатов в формате JSON")
+    parser.add_argument("--compare", help="JSON с результатами предыдущего запуска для поиска регрессий")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое замедление, доля")
+    args = parser.parse_args()
+
+    cars, expenses_per_car = PRESETS[args.preset]
+    cars = args.cars or cars
+    expenses_per_car = args.expenses or expenses_per_car
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        car_ids = generate_fleet(os.path.join(tmp_dir, "benchmark.db"), cars, expenses_per_car, seed=args.seed)
+        generate_seconds = time.perf_counter() - start
+        results = run_benchmarks(car_ids, repeat=args.repeat, tmp_dir=tmp_dir)
+        storage.close_connections()
+
+    report = {
+        "meta": {
+            "cars": cars,
+            "expenses_per_car": expenses_per_car,
+            "seed": args.seed,
+            "generate_seconds": generate_seconds,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output)
+    print(output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for name, previous, current in regressions:
+            print(f"Регрессия {name}: {previous:.4f} с -> {current:.4f} с", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
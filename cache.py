@@ -0,0 +1,156 @@
+# cache.py
+import functools
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+# Ограничения кеша: количество записей и примерный объём в байтах
+MAX_ENTRIES = 512
+MAX_BYTES = 32 * 1024 * 1024
+
+# Версии данных А/М. Функции записи storage увеличивают версию изменённого А/М,
+# записи кеша, посчитанные для старой версии, считаются устаревшими.
+# Версии живут в памяти процесса; изменения, сделанные другими процессами, обнаруживает
+# проверка, которую задаёт storage (set_change_check), и сбрасывает версии всех А/М (bump_all)
+_versions = {}
+_base_version = 0  # версия А/М, данные которых ещё не менялись
+_fleet_version = 0
+_versions_lock = threading.Lock()
+_change_check = None
+
+def data_version(car_id: int|None) -> int:
+    """
+    Возвращает версию данных А/М; для car_id = None - версию данных всего автопарка
+    """
+    if car_id is None:
+        return _fleet_version
+    return _versions.get(car_id, _base_version)
+
+def bump_version(car_id: int):
+    """
+    Отмечает изменение данных А/М (и, соответственно, автопарка)
+    """
+    global _fleet_version
+    with _versions_lock:
+        _versions[car_id] = _versions.get(car_id, _base_version) + 1
+        _fleet_version += 1
+
+def bump_all():
+    """
+    Отмечает изменение данных всех А/М, например записью другого процесса
+    """
+    global _base_version, _fleet_version
+    with _versions_lock:
+        _base_version += 1
+        for car_id in _versions:
+            _versions[car_id] += 1
+        _fleet_version += 1
+
+def set_change_check(check):
+    """
+    Задаёт функцию, которая перед каждым обращением к кешу проверяет изменения данных
+    в обход этого процесса и при необходимости вызывает bump_all
+    """
+    global _change_check
+    _change_check = check
+
+def approx_size(value) -> int:
+    """
+    Оценивает объём значения в памяти с учётом вложенных коллекций
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(key) + approx_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset, sqlite3.Row)):
+        size += sum(approx_size(item) for item in value)
+    elif type(value).__sizeof__ is object.__sizeof__:
+        # Объекты без собственного __sizeof__ (в отличие, например, от DataFrame) оцениваем по атрибутам
+        if hasattr(value, "__dict__"):
+            size += approx_size(vars(value))
+        for name in getattr(type(value), "__slots__", ()):
+            size += approx_size(getattr(value, name, None))
+    return size
+
+class VersionedCache:
+    """
+    LRU-кеш результатов по ключу и версии данных А/М.
+    Запись вытесняется, когда превышено число записей или примерный объём
+    """
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # ключ -> (версия, значение, размер)
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, car_id: int|None, compute):
+        """
+        Возвращает значение из кеша, если оно посчитано для текущей версии данных А/М,
+        иначе вычисляет его через compute() и сохраняет
+        """
+        if _change_check is not None:
+            _change_check()
+        version = data_version(car_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Версия зафиксирована до вычисления: если данные изменятся во время compute,
+        # запись окажется устаревшей и будет пересчитана при следующем обращении
+        value = compute()
+        self.put(key, version, value)
+        return value
+
+    def put(self, key, version: int, value):
+        size = approx_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[2]
+            self._entries[key] = (version, value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+_cache = VersionedCache()
+
+def cached(kind: str, car_id: int|None, compute, *args):
+    """
+    Возвращает результат compute() из общего кеша по ключу (kind, car_id, args)
+    и версии данных А/М; car_id = None - результат по всему автопарку
+    """
+    return _cache.get_or_compute((kind, car_id, args), car_id, compute)
+
+def per_car(func):
+    """
+    Кеширует результат функции, первый аргумент которой - ID А/М (None - весь автопарк)
+    """
+    @functools.wraps(func)
+    def wrapper(car_id, *args, **kwargs):
+        key = (func.__module__, func.__qualname__, car_id, args, tuple(sorted(kwargs.items())))
+        return _cache.get_or_compute(key, car_id, lambda: func(car_id, *args, **kwargs))
+    return wrapper
+
+def clear():
+    """
+    Очищает общий кеш
+    """
+    _cache.clear()
@@ -0,0 +1,41 @@
+# charts.py
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from analytics import CAR_CHARTS, has_data
+
+class ChartPanel:
+    """
+    Панель графиков, встроенная в таб А/М. Использует одну Figure на всё время жизни таба:
+    при смене данных того же графика обновляются уже нарисованные элементы,
+    при смене графика очищаются только оси
+    """
+    def __init__(self, parent, figsize=(7, 3), dpi=100):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.figure.subplots_adjust(left=0.1, right=0.97, bottom=0.15, top=0.88)
+        self.ax = self.figure.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figure, master=parent)
+        self.widget = self.canvas.get_tk_widget()
+        self.chart = None
+        self.artists = None
+
+    def show(self, chart, data):
+        """
+        Показывает график chart (ключ analytics.CAR_CHARTS) по данным его функции данных
+        """
+        _, draw_function, update_function, _ = CAR_CHARTS[chart]
+        if not has_data(data):
+            self.ax.clear()
+            self.ax.text(0.5, 0.5, "Нет данных", ha="center", va="center", transform=self.ax.transAxes)
+            self.ax.set_axis_off()
+            # Название графика сохраняется: при появлении данных он будет нарисован заново
+            self.chart = chart
+            self.artists = None
+        elif (chart != self.chart or self.artists is None or update_function is None
+              or not update_function(self.ax, self.artists, data)):
+            self.ax.clear()
+            self.ax.set_axis_on()
+            # Круговая диаграмма требует равного масштаба осей, остальные графики - нет
+            self.ax.set_aspect("auto")
+            self.artists = draw_function(self.ax, data)
+            self.chart = chart
+        self.canvas.draw_idle()
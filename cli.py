@@ -0,0 +1,110 @@
+# cli.py
+import os
+
+# Графики рисуются без окон; переменная наследуется процессами пула
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import argparse
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from storage import init_storage, load_cars, rebuild_rollups
+from exporter import export_expenses
+
+# Колонки сводки по стоимости километра, выводимые в консоль
+SUMMARY_COLUMNS = ['car_id', 'model', 'year', 'expense_count', 'total_amount', 'max_mileage', 'cost_per_km', 'cost_per_year']
+
+def _init_worker(db_file):
+    """
+    Подготавливает процесс пула: открывает ту же БД, что и основной процесс
+    """
+    init_storage(db_file)
+
+def _render_car(car_id, directory):
+    import analytics
+    return analytics.render_car_charts(car_id, directory)
+
+def render_charts(car_ids, directory, db_file=None, workers=None):
+    """
+    Сохраняет графики выбранных А/М в PNG, распределяя А/М по процессам пула.
+    Процессы запускаются методом spawn: соединения с БД не наследуются через fork
+    Возвращает список путей сохранённых файлов
+    """
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    # Крупные порции заданий уменьшают накладные расходы на передачу между процессами
+    chunksize = max(1, len(car_ids) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(db_file,)) as pool:
+        results = pool.map(_render_car, car_ids, [directory] * len(car_ids), chunksize=chunksize)
+        return [path for paths in results for path in paths]
+
+def write_summary(path=None, car_ids=None, sort_by="cost_per_km"):
+    """
+    Формирует сводку по стоимости километра и сохраняет её в .csv или .xlsx; без path - выводит в консоль
+    """
+    import analytics
+    summary = analytics.fleet_summary(sort_by=sort_by)
+    if car_ids is not None:
+        summary = summary[summary['car_id'].isin(car_ids)]
+    if path is None:
+        print(summary[SUMMARY_COLUMNS].to_string(index=False))
+    elif path.lower().endswith(".xlsx"):
+        summary.to_excel(path, index=False)
+    else:
+        summary.to_csv(path, index=False, encoding="utf-8-sig")
+    return summary
+
+def main(argv=None):
+    # Общие параметры задаются после команды: cli.py charts out --cars 1 2
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", help="путь к файлу БД")
+    common.add_argument("--cars", type=int, nargs="+", help="ID А/М; по умолчанию - все")
+
+    parser = argparse.ArgumentParser(description="Отчёты по автопарку без графического интерфейса")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    summary_parser = commands.add_parser("summary", parents=[common], help="сводка по стоимости километра")
+    summary_parser.add_argument("--output", help="файл .csv или .xlsx; по умолчанию - вывод в консоль")
+    summary_parser.add_argument("--sort", default="cost_per_km", help="колонка сортировки")
+
+    charts_parser = commands.add_parser("charts", parents=[common], help="графики А/М в PNG")
+    charts_parser.add_argument("directory", help="папка для графиков")
+    charts_parser.add_argument("--workers", type=int, help="количество процессов; по умолчанию - по числу ядер")
+
+    export_parser = commands.add_parser("export", parents=[common], help="выгрузка расходов в .xlsx, .csv или .parquet")
+    export_parser.add_argument("path", help="файл выгрузки")
+
+    report_parser = commands.add_parser("report", parents=[common], help="сводка, графики и выгрузка в одну папку")
+    report_parser.add_argument("directory", help="папка отчёта")
+    report_parser.add_argument("--workers", type=int, help="количество процессов; по умолчанию - по числу ядер")
+    report_parser.add_argument("--format", choices=["xlsx", "csv", "parquet"], default="xlsx", help="формат выгрузки")
+
+    commands.add_parser("rebuild-rollups", parents=[common], help="пересчёт месячных итогов расходов по категориям")
+
+    args = parser.parse_args(argv)
+    init_storage(args.db)
+    car_ids = args.cars or [car.id for car in load_cars()]
+    start = time.perf_counter()
+
+    if args.command == "summary":
+        write_summary(args.output, args.cars, sort_by=args.sort)
+    elif args.command == "charts":
+        paths = render_charts(car_ids, args.directory, args.db, args.workers)
+        print(f"Сохранено графиков: {len(paths)}")
+    elif args.command == "export":
+        print(f"Выгружено строк: {export_expenses(args.path, args.cars)}")
+    elif args.command == "report":
+        os.makedirs(args.directory, exist_ok=True)
+        write_summary(os.path.join(args.directory, "summary.csv"), args.cars)
+        exported = export_expenses(os.path.join(args.directory, f"expenses.{args.format}"), args.cars)
+        paths = render_charts(car_ids, os.path.join(args.directory, "charts"), args.db, args.workers)
+        print(f"Выгружено строк: {exported}, сохранено графиков: {len(paths)}")
+    elif args.command == "rebuild-rollups":
+        rebuilt = sum(rebuild_rollups(car_id) for car_id in args.cars) if args.cars else rebuild_rollups()
+        print(f"Пересчитано строк итогов: {rebuilt}")
+    print(f"Готово за {time.perf_counter() - start:.1f} с", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# cost_index.py
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+import cache
+import storage
+from utils import to_day
+
+class CostIndex:
+    """
+    Индекс накопленных сумм расходов А/М в двух порядках: по пробегу и по дате.
+    Сумма трат и прирост пробега для любого окна считаются двумя бинарными поисками - O(log n).
+    Новые расходы обычно добавляются в конец (пробег и дата растут), тогда обновление - O(1);
+    вставка в середину пересчитывает накопленные суммы только после места вставки
+    """
+    def __init__(self, start_mileage: float, batch=None):
+        self.start_mileage = start_mileage
+        self._lock = threading.Lock()
+        # Порядок по пробегу: ключ (mileage, id), cum[k] - сумма первых k трат
+        self.mileages = array("d")
+        self.mileage_ids = array("q")
+        self.mileage_amounts = array("d")
+        self.mileage_cum = array("d", [0.0])
+        # Порядок по дате: ключ (day, id), max_mileage[k] - наибольший пробег среди первых k трат
+        self.days = array("q")
+        self.day_ids = array("q")
+        self.day_amounts = array("d")
+        self.day_mileages = array("d")
+        self.day_cum = array("d", [0.0])
+        self.day_max_mileage = array("d", [start_mileage])
+        if batch is not None and len(batch):
+            self._build(batch)
+
+    def _build(self, batch):
+        # ExpenseBatch уже упорядочен по (mileage, id)
+        self.mileages.extend(batch.mileages)
+        self.mileage_ids.extend(batch.ids)
+        self.mileage_amounts.extend(batch.amounts)
+        self._recompute_mileage(0)
+
+        order = sorted(range(len(batch)), key=lambda i: (batch.days[i], batch.ids[i]))
+        self.days.extend(batch.days[i] for i in order)
+        self.day_ids.extend(batch.ids[i] for i in order)
+        self.day_amounts.extend(batch.amounts[i] for i in order)
+        self.day_mileages.extend(batch.mileages[i] for i in order)
+        self._recompute_days(0)
+
+    def _recompute_mileage(self, start: int):
+        del self.mileage_cum[start + 1:]
+        total = self.mileage_cum[start]
+        for amount in self.mileage_amounts[start:]:
+            total += amount
+            self.mileage_cum.append(total)
+
+    def _recompute_days(self, start: int):
+        del self.day_cum[start + 1:]
+        del self.day_max_mileage[start + 1:]
+        total = self.day_cum[start]
+        max_mileage = self.day_max_mileage[start]
+        for amount, mileage in zip(self.day_amounts[start:], self.day_mileages[start:]):
+            total += amount
+            max_mileage = max(max_mileage, mileage)
+            self.day_cum.append(total)
+            self.day_max_mileage.append(max_mileage)
+
+    def __len__(self):
+        return len(self.mileage_ids)
+
+    def add(self, expense_id: int, amount: float, mileage: float, day: int):
+        """
+        Учитывает новый расход; уже учтённый id игнорируется: индекс, построенный между фиксацией записи
+        и уведомлением о ней, уже содержит эту строку
+        """
+        with self._lock:
+            if self._find(self.mileages, self.mileage_ids, mileage, expense_id) is not None:
+                return
+            # id новых расходов больше существующих, поэтому при равном ключе запись встаёт последней
+            position = bisect_right(self.mileages, mileage)
+            self.mileages.insert(position, mileage)
+            self.mileage_ids.insert(position, expense_id)
+            self.mileage_amounts.insert(position, amount)
+            self._recompute_mileage(position)
+
+            position = bisect_right(self.days, day)
+            self.days.insert(position, day)
+            self.day_ids.insert(position, expense_id)
+            self.day_amounts.insert(position, amount)
+            self.day_mileages.insert(position, mileage)
+            self._recompute_days(position)
+
+    def remove(self, expense_id: int, mileage: float, day: int):
+        """Исключает удалённый расход; неизвестный id игнорируется"""
+        with self._lock:
+            position = self._find(self.mileages, self.mileage_ids, mileage, expense_id)
+            if position is None:
+                return
+            for column in (self.mileages, self.mileage_ids, self.mileage_amounts):
+                del column[position]
+            self._recompute_mileage(position)
+
+            position = self._find(self.days, self.day_ids, day, expense_id)
+            for column in (self.days, self.day_ids, self.day_amounts, self.day_mileages):
+                del column[position]
+            self._recompute_days(position)
+
+    @staticmethod
+    def _find(keys, ids, key, expense_id: int):
+        for position in range(bisect_left(keys, key), bisect_right(keys, key)):
+            if ids[position] == expense_id:
+                return position
+        return None
+
+    def mileage_window(self, mileage_from: float, mileage_to: float) -> tuple:
+        """
+        Сумма трат с пробегом в интервале (mileage_from, mileage_to] и пройденный в нём пробег,
+        ограниченный пробегом на момент покупки и последней тратой
+        Возвращает пару (сумма, км)
+        """
+        with self._lock:
+            spent = (self.mileage_cum[bisect_right(self.mileages, mileage_to)]
+                     - self.mileage_cum[bisect_right(self.mileages, mileage_from)])
+            last_mileage = self.mileages[-1] if self.mileages else self.start_mileage
+        distance = min(mileage_to, last_mileage) - max(mileage_from, self.start_mileage)
+        return spent, max(distance, 0.0)
+
+    def date_window(self, date_from=None, date_to=None) -> tuple:
+        """
+        Сумма трат за период (границы включительно; строки YYYY-MM-DD или datetime.date, None - без границы)
+        и пройденный за период пробег: от наибольшего пробега до начала периода до наибольшего к его концу
+        Возвращает пару (сумма, км)
+        """
+        with self._lock:
+            start = 0 if date_from is None else bisect_left(self.days, to_day(date_from))
+            end = len(self.days) if date_to is None else bisect_right(self.days, to_day(date_to))
+            end = max(start, end)
+            return (self.day_cum[end] - self.day_cum[start],
+                    self.day_max_mileage[end] - self.day_max_mileage[start])
+
+    def cost_per_km(self, mileage_from: float = None, mileage_to: float = None, date_from=None, date_to=None):
+        """
+        Стоимость километра (руб/км) в окне по пробегу либо по датам; без границ - за всё время.
+        Возвращает None, если в окне не пройдено ни одного километра
+        """
+        if date_from is not None or date_to is not None:
+            spent, distance = self.date_window(date_from, date_to)
+        else:
+            spent, distance = self.mileage_window(
+                self.start_mileage if mileage_from is None else mileage_from,
+                float("inf") if mileage_to is None else mileage_to)
+        return spent / distance if distance > 0 else None
+
+    def last_km(self, km: float):
+        """Стоимость километра за последние km километров"""
+        with self._lock:
+            last_mileage = self.mileages[-1] if self.mileages else self.start_mileage
+        return self.cost_per_km(last_mileage - km, last_mileage)
+
+    def rolling_cost_per_km(self, window_km: float) -> tuple:
+        """
+        Скользящая стоимость километра за последние window_km км в точке каждой траты (по возрастанию пробега).
+        Считается за один проход двумя указателями
+        Возвращает пару списков (пробеги, руб/км); точки без пройденного пробега пропускаются
+        """
+        points, values = [], []
+        with self._lock:
+            left = 0
+            cum = self.mileage_cum
+            for right, mileage in enumerate(self.mileages):
+                while self.mileages[left] <= mileage - window_km:
+                    left += 1
+                distance = mileage - max(mileage - window_km, self.start_mileage)
+                if distance > 0:
+                    points.append(mileage)
+                    values.append((cum[right + 1] - cum[left]) / distance)
+        return points, values
+
+    def __repr__(self):
+        return f"CostIndex: {len(self)} expenses from {self.start_mileage} km"
+
+# Индексы по ID А/М, обновляются по уведомлениям storage о записи
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_cost_index(car) -> CostIndex:
+    """
+    Возвращает индекс расходов А/М; при первом обращении строит его по колоночной выборке из БД.
+    Изменения БД другими процессами сбрасывают индексы (storage.check_external_changes)
+    """
+    storage.check_external_changes()
+    with _indexes_lock:
+        index = _indexes.get(car.id)
+    if index is None:
+        version = cache.data_version(car.id)
+        index = CostIndex(car.mileage, storage.load_expense_batch(car.id))
+        with _indexes_lock:
+            # Если данные изменились во время построения, уведомление могло разойтись с выборкой:
+            # такой индекс не сохраняется и будет построен заново при следующем обращении
+            if cache.data_version(car.id) == version:
+                index = _indexes.setdefault(car.id, index)
+    return index
+
+def _on_expenses_changed(event: str, car_id: int|None, rows):
+    with _indexes_lock:
+        if event == "reset":
+            # Массовые изменения проще перестроить при следующем обращении
+            if car_id is None:
+                _indexes.clear()
+            else:
+                _indexes.pop(car_id, None)
+            return
+        index = _indexes.get(car_id)
+        if index is None:
+            return
+    for row in rows:
+        if event == "insert":
+            index.add(row["id"], row["amount"], row["mileage"], row["day"])
+        elif event == "delete":
+            index.remove(row["id"], row["mileage"], row["day"])
+
+storage.add_listener(_on_expenses_changed)
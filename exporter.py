@@ -0,0 +1,97 @@
+# exporter.py
+import csv
+import os
+from concurrent.futures import CancelledError
+from storage import iter_expenses
+
+EXPORT_COLUMNS = ['id', 'car_id', 'amount', 'category', 'date', 'description', 'mileage']
+# Максимум строк на листе Excel (вместе со строкой заголовка)
+XLSX_MAX_ROWS = 1048576
+
+def _write_csv(path, chunks):
+    # utf-8-sig: Excel корректно открывает кириллицу только с BOM
+    with open(path, "w", newline="", encoding="utf-8-sig") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows(rows)
+
+def _write_xlsx(path, chunks):
+    try:
+        from openpyxl import Workbook
+    except ImportError as e:
+        raise RuntimeError("Для выгрузки в xlsx нужна библиотека openpyxl") from e
+
+    # В режиме write_only строки сразу сбрасываются на диск, а не копятся в памяти
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    for rows in chunks:
+        for row in rows:
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Expenses {len(workbook.worksheets) + 1}" if workbook.worksheets else "Expenses")
+                sheet.append(EXPORT_COLUMNS)
+                sheet_rows = 1
+            sheet.append(tuple(row))
+            sheet_rows += 1
+    if sheet is None:
+        workbook.create_sheet("Expenses").append(EXPORT_COLUMNS)
+    workbook.save(path)
+
+def _write_parquet(path, chunks):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Для выгрузки в parquet нужна библиотека pyarrow") from e
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("car_id", pa.int64()),
+        ("amount", pa.float64()),
+        ("category", pa.string()),
+        ("date", pa.string()),
+        ("description", pa.string()),
+        ("mileage", pa.float64()),
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+
+WRITERS = {
+    ".csv": _write_csv,
+    ".xlsx": _write_xlsx,
+    ".parquet": _write_parquet,
+}
+
+def export_expenses(path: str, car_ids: list|None = None, chunk_size: int = 5000, cancel_event=None) -> int:
+    """
+    Потоково выгружает расходы выбранных А/М (или всего автопарка при car_ids = None) в файл.
+    Формат определяется расширением файла: .xlsx, .csv или .parquet.
+    Строки читаются из БД пачками по chunk_size, поэтому расход памяти не зависит от объёма выгрузки.
+    Файл сначала пишется во временный и заменяет path только после успешной записи.
+    Возвращает количество выгруженных строк
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Неподдерживаемый формат выгрузки: {extension or path}")
+
+    exported = 0
+
+    def chunks():
+        nonlocal exported
+        for rows in iter_expenses(car_ids, chunk_size=chunk_size):
+            if cancel_event is not None and cancel_event.is_set():
+                raise CancelledError("Выгрузка отменена")
+            exported += len(rows)
+            yield rows
+
+    tmp_path = path + ".part"
+    try:
+        WRITERS[extension](tmp_path, chunks())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return exported
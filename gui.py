@@ -1,11 +1,47 @@
 # gui.py
+import bisect
+import importlib
+import math
+import threading
 import tkinter as tk
-from tkinter import ttk, messagebox
-from models import Expense, Car
-from storage import save_expense, load_expenses, save_car, load_cars, delete_car, delete_expense
+from tkinter import ttk, messagebox, filedialog
+from models import Expense, Car, CarStats
+from storage import (save_expense, load_expenses_page, load_car_stats, save_car, load_cars, delete_car,
+                     delete_expenses, delete_filtered_expenses, search_expenses)
 from utils import validate_amount, validate_date
 from datetime import datetime
-from analytics import show_expenses_categories, show_expenses_by_year, export_to_excel
+from exporter import export_expenses
+from importer import import_expenses_csv
+from worker import BackgroundExecutor
+import cache
+import profiling
+
+# Через сколько миллисекунд после запуска начинать фоновую загрузку модуля аналитики
+# (pandas и matplotlib), чтобы первый график открывался без задержки. None - не загружать заранее
+PREWARM_ANALYTICS_DELAY = 2000
+
+def load_analytics():
+    """
+    Импортирует модуль аналитики при первом обращении.
+    pandas и matplotlib грузятся долго и не нужны для ввода трат, поэтому не импортируются при запуске
+    """
+    return importlib.import_module("analytics")
+
+def load_charts():
+    """
+    Импортирует модуль панели графиков (вместе с аналитикой и matplotlib) при первом обращении
+    """
+    return importlib.import_module("charts")
+
+EXPORT_FILETYPES = [("Excel", "*.xlsx"), ("CSV", "*.csv"), ("Parquet", "*.parquet")]
+
+EXPENSE_CATEGORIES = ["ТО (тех.обслуживание)", "Страховка (КАСКО, ОСАГО)", "Топливо", "Мойки", "Платные парковки", "Другое"]
+# Значение фильтра таблицы расходов без ограничения по категории
+ALL_CATEGORIES = "Все категории"
+
+# Размер страницы таблицы расходов и запас строк, при котором подгружается следующая страница
+PAGE_SIZE = 100
+PREFETCH_ROWS = 30
 
 class CarExpensesApp:
     def __init__(self, root):
@@ -13,10 +49,14 @@ class CarExpensesApp:
         self.root.title("Калькулятор стоимости владения А/М")
         self.root.geometry("800x600")
         self.root.minsize(700, 500)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.create_widgets()
+        self.executor = BackgroundExecutor(self.root, on_busy_changed=self.on_busy_changed)
+        if PREWARM_ANALYTICS_DELAY is not None:
+            self.root.after(PREWARM_ANALYTICS_DELAY, self.prewarm_analytics)
         self.refresh_cars_tabs()
         if self.cars_frames:
-            self.refresh_car_expenses_table(list(self.cars_frames.keys())[0])
+            self.show_car_tab(next(iter(self.cars_frames)))
 
     def create_widgets(self):
         """
@@ -27,9 +67,25 @@ class CarExpensesApp:
         input_frame.pack(fill="x", padx=10, pady=10)
         add_btn = ttk.Button(input_frame, text=" Добавить авто", command=self.show_add_car_popup)
         add_btn.grid(row=0, column=0)
+        fleet_btn = ttk.Button(input_frame, text="Сводка по автопарку",
+                               command=lambda: self.run_in_background(lambda: load_analytics().fleet_summary(),
+                                                                      on_done=self.show_fleet_summary))
+        fleet_btn.grid(row=0, column=1, padx=(5, 0))
+        fleet_export_btn = ttk.Button(input_frame, text="Выгрузить автопарк", command=self.show_export_cars_popup)
+        fleet_export_btn.grid(row=0, column=2, padx=(5, 0))
+
+        # Индикатор фоновых задач, показывается только пока задачи выполняются
+        self.busy_label = ttk.Label(input_frame)
+        self.busy_label.grid(row=0, column=3, padx=(20, 5))
+        self.busy_progress = ttk.Progressbar(input_frame, mode="indeterminate", length=120)
+        self.busy_progress.grid(row=0, column=4)
+        self.busy_cancel_btn = ttk.Button(input_frame, text="Отмена", command=lambda: self.executor.cancel_all())
+        self.busy_cancel_btn.grid(row=0, column=5, padx=(5, 0))
+        self.on_busy_changed(0)
 
         self.tab_control = ttk.Notebook(self.root, padding=(10, 10))
         self.tab_control.bind("<<NotebookTabChanged>>", self.on_car_select)
+        self.tab_control.pack(expand=1, fill="both")
 
     def add_expense(self, car_id):
         """Добавляет новую трату после валидации."""
@@ -57,42 +113,308 @@ class CarExpensesApp:
             )
 
             # 3. Сохраняем
-            save_expense(expense)
+            expense.id = save_expense(expense)
+            if expense.id is None:
+                raise ValueError("Ошибка при сохранении данных")
 
-            self.refresh_car_expenses_table(car_id)
+            self.insert_expense_row(car_id, expense)
             self.expense_popup.destroy()
             messagebox.showinfo("Успех", f"Трата добавлена:\n{expense}")
 
         except Exception as e:
             messagebox.showerror("Ошибка ввода", f"Не удалось добавить операцию:\n{e}")
 
+    def run_in_background(self, fn, *args, on_done=None, cancellable=False, **kwargs):
+        """
+        Выполняет fn в фоновом потоке, не блокируя интерфейс.
+        on_done вызывается с результатом в потоке Tk, ошибка показывается пользователю
+        """
+        return self.executor.submit(fn, *args, on_done=on_done, on_error=self.show_background_error,
+                                    cancellable=cancellable, **kwargs)
+
+    def show_chart(self, car_id, chart):
+        """
+        Получает данные графика chart (ключ analytics.CAR_CHARTS) в фоновом потоке
+        (там же при первом обращении импортируются модули графиков) и показывает его на панели графиков таба
+        """
+        def load_data():
+            load_charts()
+            return load_analytics().CAR_CHARTS[chart][0](car_id)
+
+        def show(data):
+            if car_id in self.cars_frames:
+                self.get_chart_panel(car_id).show(chart, data)
+
+        self.run_in_background(load_data, on_done=show)
+
+    def get_chart_panel(self, car_id):
+        """
+        Возвращает панель графиков таба А/М, при первом обращении встраивает её под таблицей
+        """
+        car_frame = self.cars_frames[car_id]
+        if car_frame.get('chart_panel') is None:
+            chart_frame = ttk.LabelFrame(car_frame['tab'], text=" 📈 Графики ", padding=(10, 10))
+            chart_frame.pack(fill="x", padx=10, pady=5)
+            panel = load_charts().ChartPanel(chart_frame)
+            panel.widget.pack(fill="both", expand=True)
+            car_frame['chart_panel'] = panel
+        return car_frame['chart_panel']
+
+    def refresh_chart(self, car_id):
+        """
+        Пересчитывает показанный на панели график после изменения трат; график обновляется на месте
+        """
+        panel = self.cars_frames[car_id].get('chart_panel')
+        if panel is not None and panel.chart is not None:
+            self.show_chart(car_id, panel.chart)
+
+    def prewarm_analytics(self):
+        """
+        Загружает модули аналитики и графиков в фоновом потоке, пока пользователь работает с таблицей
+        """
+        threading.Thread(target=load_charts, name="prewarm-analytics", daemon=True).start()
+
+    def show_background_error(self, error):
+        messagebox.showerror("Ошибка", f"Не удалось выполнить операцию:\n{error}")
+
+    def on_busy_changed(self, tasks_count):
+        """
+        Показывает или скрывает индикатор выполнения фоновых задач
+        """
+        widgets = (self.busy_label, self.busy_progress, self.busy_cancel_btn)
+        if tasks_count:
+            self.busy_label.configure(text=f"Выполняется задач: {tasks_count}")
+            for widget in widgets:
+                widget.grid()
+            self.busy_progress.start(10)
+        else:
+            self.busy_progress.stop()
+            for widget in widgets:
+                widget.grid_remove()
+
+    def on_close(self):
+        """
+        Закрывает приложение, отменяя фоновые задачи
+        """
+        self.executor.shutdown()
+        self.root.destroy()
+
+    def export_expenses(self, car_ids, initial_file="expenses.xlsx"):
+        """
+        Выгружает траты выбранных А/М (None - всего автопарка) в файл, выбранный пользователем.
+        Формат определяется расширением файла, выгрузка идёт в фоновом потоке
+        """
+        path = filedialog.asksaveasfilename(title="Выгрузка расходов", initialfile=initial_file, defaultextension=".xlsx",
+                                            filetypes=EXPORT_FILETYPES)
+        if not path:
+            return
+        self.run_in_background(export_expenses, path, car_ids, cancellable=True,
+                               on_done=lambda count: messagebox.showinfo("Выгрузка завершена", f"Выгружено трат: {count}\n{path}"))
+
+    def show_export_cars_popup(self):
+        """
+        Создает окно выбора А/М для выгрузки трат нескольких А/М или всего автопарка
+        """
+        popup = tk.Toplevel(self.root)
+        popup.title("Выгрузка трат автопарка")
+        popup.geometry("320x300")
+
+        ttk.Label(popup, text="А/М для выгрузки:").pack(anchor="w", padx=10, pady=(10, 0))
+        listbox = tk.Listbox(popup, selectmode="extended", exportselection=False)
+        listbox.pack(fill="both", expand=True, padx=10, pady=5)
+        car_ids = list(self.cars_frames)
+        for car_id in car_ids:
+            car = self.cars_frames[car_id]['car_item']
+            listbox.insert("end", f"{car.model} {car.year}")
+        listbox.selection_set(0, "end")
+
+        def export():
+            selected = [car_ids[index] for index in listbox.curselection()]
+            if not selected:
+                messagebox.showwarning("Ни один А/М не выбран", "Выберите А/М для выгрузки", parent=popup)
+                return
+            popup.destroy()
+            self.export_expenses(None if len(selected) == len(car_ids) else selected, initial_file="fleet.xlsx")
+
+        ttk.Button(popup, text="Выгрузить", command=export).pack(anchor="w", padx=10, pady=(0, 10))
+        popup.grab_set()
+
+    def import_expenses(self, car_id):
+        """
+        Импортирует траты А/М из CSV-файла, выбранного пользователем, в фоновом потоке
+        """
+        path = filedialog.askopenfilename(title="Импорт расходов", filetypes=[("CSV", "*.csv"), ("Все файлы", "*.*")])
+        if not path:
+            return
+        self.run_in_background(import_expenses_csv, path, car_id=car_id, cancellable=True,
+                               on_done=lambda report: self.show_import_report(car_id, report))
+
+    def show_import_report(self, car_id, report):
+        """
+        Обновляет таблицу после импорта и показывает итоги импорта
+        """
+        if car_id in self.cars_frames and self.cars_frames[car_id]['built']:
+            self.refresh_car_expenses_table(car_id)
+        message = str(report)
+        if report.rejected:
+            # Показываем только начало списка, полный список может быть очень длинным
+            lines = [f"Строка {line}: {error}" for line, error in report.rejected[:20]]
+            message += "\n\n" + "\n".join(lines)
+        messagebox.showinfo("Импорт завершён", message)
+
+    @profiling.timed
     def refresh_car_expenses_table(self, car_id):
         """
-        Формирует таблицу расходов по А/М
+        Формирует таблицу расходов по А/М. Загружается только последняя страница операций,
+        более ранние подгружаются при прокрутке вверх (см. on_tree_scroll)
         """
         car_frame = self.cars_frames.get(car_id)
 
         tree = car_frame['tree']
-        for item in tree.get_children():
-            tree.delete(item)
-        expenses = load_expenses(car_id)
-        # Добавляем все операции
-        for t in expenses:
-            tree.insert("", "end", values=(
-                t.id,
-                f"{t.amount:.2f}",
-                t.category,
-                datetime.strptime(t.date, '%Y-%m-%d').strftime('%d.%m.%Y'),
-                t.mileage,
-                t.description
-            ))
-
-        # Скролл вниз (к новой операции)
-        tree.yview_moveto(1.0)
-
-        # Формируем информацию об авто
-        car_frame['car_item'].expenses = expenses
+        tree.delete(*tree.get_children())
+        if car_frame.get('loading'):
+            self.root.after_cancel(car_frame['pending_load'])
+        car_frame['oldest_key'] = None
+        car_frame['keys'] = []
+        car_frame['exhausted'] = False
+        car_frame['loading'] = False
+        if car_frame['search']:
+            # Результаты поиска идут по релевантности, следующие страницы подгружаются при прокрутке вниз
+            self.load_search_page(car_id)
+            tree.yview_moveto(0.0)
+        else:
+            self.load_previous_page(car_id)
+            # Скролл вниз (к новой операции)
+            tree.yview_moveto(1.0)
+
+        # Формируем информацию об авто по агрегатам из БД
+        car_frame['car_item'].stats = cache.cached("car_stats", car_id, lambda: load_car_stats(car_id))
         car_frame['heading'].configure(text=car_frame['car_item'])
+        self.refresh_chart(car_id)
+
+    @profiling.timed
+    def load_previous_page(self, car_id):
+        """
+        Подгружает в начало таблицы страницу операций, предшествующих самой ранней загруженной
+        """
+        car_frame = self.cars_frames.get(car_id)
+        if car_frame is None or car_frame['exhausted']:
+            return
+        tree = car_frame['tree']
+        before = car_frame['oldest_key']
+        category = car_frame['category']
+        rows = cache.cached("expense_rows", car_id, lambda: self.load_page_rows(car_id, before, category), before, category)
+        for index, (key, values) in enumerate(rows):
+            tree.insert("", index, iid=str(key[1]), values=values)
+        car_frame['keys'][0:0] = [key for key, values in rows]
+        if rows:
+            car_frame['oldest_key'] = rows[0][0]
+            # Сохраняем положение прокрутки: видимые строки сдвинулись вниз на размер страницы
+            if before is not None:
+                tree.yview_scroll(len(rows), "units")
+        car_frame['exhausted'] = len(rows) < PAGE_SIZE
+        car_frame['loading'] = False
+
+    @profiling.timed
+    def load_search_page(self, car_id):
+        """
+        Подгружает в конец таблицы следующую страницу результатов поиска
+        """
+        car_frame = self.cars_frames.get(car_id)
+        if car_frame is None or car_frame['exhausted']:
+            return
+        tree = car_frame['tree']
+        expenses = search_expenses(car_frame['search'], car_id, category=car_frame['category'],
+                                   limit=PAGE_SIZE, offset=len(car_frame['keys']))
+        for expense in expenses:
+            tree.insert("", "end", iid=str(expense.id), values=self.expense_row_values(expense))
+            car_frame['keys'].append((expense.mileage, expense.id))
+        car_frame['exhausted'] = len(expenses) < PAGE_SIZE
+        car_frame['loading'] = False
+
+    def on_tree_scroll(self, car_id, scrollbar, first, last):
+        """
+        Обрабатывает прокрутку таблицы: двигает полосу прокрутки и, когда до начала
+        загруженных строк остаётся меньше PREFETCH_ROWS, подгружает предыдущую страницу.
+        В режиме поиска следующая страница результатов подгружается у конца таблицы
+        """
+        scrollbar.set(first, last)
+        car_frame = self.cars_frames.get(car_id)
+        if car_frame is None or car_frame['exhausted'] or car_frame['loading']:
+            return
+        if car_frame['search']:
+            if (1.0 - float(last)) * len(car_frame['keys']) < PREFETCH_ROWS:
+                car_frame['loading'] = True
+                car_frame['pending_load'] = self.root.after_idle(self.load_search_page, car_id)
+            return
+        rows_above = float(first) * len(car_frame['keys'])
+        if rows_above < PREFETCH_ROWS:
+            car_frame['loading'] = True
+            car_frame['pending_load'] = self.root.after_idle(self.load_previous_page, car_id)
+
+    def insert_expense_row(self, car_id, expense):
+        """
+        Вставляет в таблицу одну строку расхода на её место по пробегу и обновляет заголовок А/М
+        без перезагрузки таблицы. Расход старше загруженных страниц попадёт в таблицу при прокрутке
+        """
+        car_frame = self.cars_frames[car_id]
+        keys = car_frame['keys']
+        key = (expense.mileage, expense.id)
+        # В режиме поиска строки упорядочены по релевантности, новая трата в них не вставляется
+        filtered_out = (car_frame['search'] is not None
+                        or car_frame['category'] is not None and expense.category != car_frame['category'])
+        if not filtered_out and (car_frame['exhausted'] or (keys and key > keys[0])):
+            position = bisect.bisect(keys, key)
+            keys.insert(position, key)
+            car_frame['tree'].insert("", position, iid=str(expense.id), values=self.expense_row_values(expense))
+            car_frame['tree'].see(str(expense.id))
+
+        car = car_frame['car_item']
+        car.stats.add(expense)
+        car_frame['heading'].configure(text=car)
+        self.refresh_chart(car_id)
+
+    def delete_expense_rows(self, car_id, expense_ids):
+        """
+        Удаляет из таблицы строки расходов и обновляет заголовок А/М без перезагрузки таблицы
+        """
+        car_frame = self.cars_frames.get(car_id)
+        if car_frame is None:
+            return
+        tree = car_frame['tree']
+        deleted = {str(expense_id) for expense_id in expense_ids if tree.exists(str(expense_id))}
+        car_frame['keys'] = [key for key in car_frame['keys'] if str(key[1]) not in deleted]
+        tree.delete(*deleted)
+
+        # Агрегаты в БД уже пересчитаны триггером при удалении, читаем одну строку car_stats
+        car = car_frame['car_item']
+        car.stats = load_car_stats(car_id)
+        car_frame['heading'].configure(text=car)
+        self.refresh_chart(car_id)
+
+    @classmethod
+    def load_page_rows(cls, car_id, before, category=None):
+        """
+        Загружает страницу расходов перед ключом before (только категории category, если она задана)
+        и форматирует её для таблицы
+        Возвращает список пар (ключ (пробег, id), значения строки)
+        """
+        return [((t.mileage, t.id), cls.expense_row_values(t))
+                for t in load_expenses_page(car_id, before=before, limit=PAGE_SIZE, category=category)]
+
+    @staticmethod
+    def expense_row_values(t):
+        """
+        Формирует значения строки таблицы для расхода
+        """
+        return (
+            t.id,
+            f"{t.amount:.2f}",
+            t.category,
+            f"{t.date[8:10]}.{t.date[5:7]}.{t.date[:4]}",  # YYYY-MM-DD -> DD.MM.YYYY без разбора даты
+            t.mileage,
+            t.description
+        )
 
     def show_transaction_popup(self, car_id):
         """
@@ -111,8 +433,7 @@ class CarExpensesApp:
         # Категория
         ttk.Label(self.expense_popup, text="Категория:").grid(row=1, column=0, sticky="w", padx=(10, 10), pady=(10, 0))
         self.category_var = tk.StringVar()
-        options = ["ТО (тех.обслуживание)", "Страховка (КАСКО, ОСАГО)", "Топливо", "Мойки", "Платные парковки", "Другое"]
-        category_entry = ttk.Combobox(self.expense_popup, textvariable=self.category_var, state="readonly", values=options)
+        category_entry = ttk.Combobox(self.expense_popup, textvariable=self.category_var, state="readonly", values=EXPENSE_CATEGORIES)
         category_entry.grid(row=1, column=1, sticky="w")
 
         # Дата
@@ -140,6 +461,60 @@ class CarExpensesApp:
 
         self.root.wait_window(self.expense_popup)
 
+    def show_fleet_summary(self, summary):
+        """
+        Показывает окно со сводкой по автопарку. Щелчок по заголовку колонки сортирует таблицу
+        """
+        popup = tk.Toplevel(self.root)
+        popup.title("Сводка по автопарку")
+        popup.geometry("900x400")
+
+        columns = {
+            "model": "Модель",
+            "year": "Год",
+            "total_amount": "Затраты (RUB)",
+            "max_mileage": "Пробег (км)",
+            "expense_count": "Трат",
+            "cost_per_km": "руб/км",
+            "cost_per_year": "руб/год",
+            "categories": "Основные категории",
+        }
+        tree = ttk.Treeview(popup, columns=tuple(columns), show="headings")
+        for column, text in columns.items():
+            tree.column(column, width=200 if column == "categories" else 90, anchor="w" if column in ("model", "categories") else "e")
+        scrollbar = ttk.Scrollbar(popup, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        category_columns = summary.columns[len(load_analytics().FLEET_SUMMARY_COLUMNS):]
+
+        def fill(data):
+            tree.delete(*tree.get_children())
+            for row in data.to_dict("records"):
+                # NaN в долях (у А/М нет трат) не проходит сравнение > 0
+                shares = sorted(((row[category], category) for category in category_columns if row[category] > 0), reverse=True)
+                tree.insert("", "end", values=(
+                    row["model"],
+                    row["year"],
+                    f"{row['total_amount']:.2f}",
+                    f"{row['max_mileage']:.1f}",
+                    row["expense_count"],
+                    "" if math.isnan(row["cost_per_km"]) else f"{row['cost_per_km']:.2f}",
+                    "" if math.isnan(row["cost_per_year"]) else f"{row['cost_per_year']:.2f}",
+                    ", ".join(f"{category} {share:.0%}" for share, category in shares[:3]),
+                ))
+
+        def sort_by(column, ascending):
+            fill(summary.sort_values(column, ascending=ascending, na_position="last"))
+            tree.heading(column, command=lambda: sort_by(column, not ascending))
+
+        for column, text in columns.items():
+            tree.heading(column, text=text)
+            if column != "categories":
+                tree.heading(column, command=lambda column=column: sort_by(column, False))
+        fill(summary)
+
     def show_add_car_popup(self):
         """
         Создает модальное окно добавления А/М
@@ -186,115 +561,223 @@ class CarExpensesApp:
             price=validate_amount(self.car_price_var.get()),
         )
 
-        save_car(car)
-        self.refresh_cars_tabs()
+        car.id = save_car(car)
+        if car.id is None:
+            messagebox.showerror("Ошибка", "Не удалось сохранить А/М")
+            return
+        car.stats = CarStats()
+        self.add_car_tab(car)
+        self.tab_control.select(self.cars_frames[car.id]['tab'])
         self.add_car_popup.destroy()
 
+    @profiling.timed
     def refresh_cars_tabs(self):
         """
-        Перезагружает список табов с данными об А/М
+        Перезагружает список табов с данными об А/М.
+        Для каждого А/М создается только пустой таб, виджеты строятся при первом выборе таба
         """
         self.cars_frames = {}
+        self.tabs_cars = {}
         for item in self.tab_control.winfo_children():
             self.tab_control.forget(item)
             item.destroy()
 
-        cars = load_cars()
-        for car in cars:
-            tab = ttk.Frame(self.tab_control)
-            input_frame = ttk.LabelFrame(tab, padding=(10, 10))
-            input_frame.pack(fill="x", padx=10, pady=10)
-
-            heading = ttk.Label(input_frame, text="Инфа", font=("Arial", 16))
-            heading.grid(row=0, column=0, sticky="w", pady=10, columnspan=6)
-
-            button_delete = ttk.Button(input_frame, text="Удалить авто", command=lambda car_id=car.id: self.remove_car(car_id))
-            button_delete.grid(row=1, column=0)
-
-            button_add_expense = ttk.Button(input_frame, text="Добавить трату", command=lambda car_id=car.id: self.show_transaction_popup(car_id))
-            button_add_expense.grid(row=1, column=1)
-
-            button_remove_expense = ttk.Button(input_frame, text="Удалить трату", command=lambda car_id=car.id: self.remove_expense(car_id))
-            button_remove_expense.grid(row=1, column=2)
-
-            button_show_expenses_categ = ttk.Button(input_frame, text="Затраты по категориям", command=lambda car_id=car.id: show_expenses_categories(car_id))
-            button_show_expenses_categ.grid(row=1, column=3)
-
-            button_show_expenses_categ = ttk.Button(input_frame, text="Затраты по годам",
-                                                    command=lambda car_id=car.id: show_expenses_by_year(car_id))
-            button_show_expenses_categ.grid(row=1, column=4)
-
-
-            button_export = ttk.Button(input_frame, text="Выгрузить в excel",
-                                                    command=lambda car_id=car.id: export_to_excel(car_id))
-            button_export.grid(row=1, column=5)
-
-            self.tab_control.add(tab, text=f"{car.model} {car.year}")
-            self.tab_control.pack(expand=1, fill="both")
-            # === Таблица операций ===
-            table_frame = ttk.LabelFrame(tab, text=" 📜 История операций ", padding=(10, 10))
-            table_frame.pack(fill="both", expand=True, padx=10, pady=5)
-            # Создаём Treeview (таблицу)
-            columns = ("id", "amount", "category", "date", "mileage", "description")
-            tree = ttk.Treeview(table_frame, columns=columns, show="headings", height=12)
-            tree.config(displaycolumns=("amount", "category", "date", "mileage", "description"))
-
-            self.cars_frames[car.id] = {
-                "heading": heading,
-                "car_item": car,
-                "tree": tree,
-                "tab": tab,
-            }
-
-            # Заголовки
-            tree.heading("amount", text="Сумма (RUB)")
-            tree.heading("category", text="Категория")
-            tree.heading("date", text="Дата")
-            tree.heading("mileage", text="Пробег (км)")
-            tree.heading("description", text="Описание")
-
-            # Ширина колонок
-            tree.column("amount", width=100, anchor="e")
-            tree.column("category", width=150)
-            tree.column("date", width=100, anchor="center")
-            tree.column("mileage", width=100, anchor="center")
-            tree.column("description", width=250)
-
-            # Полоса прокрутки
-            scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
-            tree.configure(yscroll=scrollbar.set)
-
-            # Размещение
-            tree.pack(side="left", fill="both", expand=True)
-            scrollbar.pack(side="right", fill="y")
+        for car in load_cars():
+            self.add_car_tab(car)
+
+    def add_car_tab(self, car):
+        """
+        Добавляет в конец списка пустой таб А/М
+        """
+        tab = ttk.Frame(self.tab_control)
+        self.tab_control.add(tab, text=f"{car.model} {car.year}")
+        self.cars_frames[car.id] = {
+            "car_item": car,
+            "tab": tab,
+            "built": False,
+        }
+        self.tabs_cars[str(tab)] = car.id
+
+    @profiling.timed
+    def build_car_tab(self, car_id):
+        """
+        Строит виджеты таба А/М: панель кнопок и таблицу операций
+        """
+        car_frame = self.cars_frames[car_id]
+        car = car_frame['car_item']
+        tab = car_frame['tab']
+
+        input_frame = ttk.LabelFrame(tab, padding=(10, 10))
+        input_frame.pack(fill="x", padx=10, pady=10)
+
+        heading = ttk.Label(input_frame, text="Инфа", font=("Arial", 16))
+        heading.grid(row=0, column=0, sticky="w", pady=10, columnspan=7)
+
+        button_delete = ttk.Button(input_frame, text="Удалить авто", command=lambda car_id=car.id: self.remove_car(car_id))
+        button_delete.grid(row=1, column=0)
+
+        button_add_expense = ttk.Button(input_frame, text="Добавить трату", command=lambda car_id=car.id: self.show_transaction_popup(car_id))
+        button_add_expense.grid(row=1, column=1)
+
+        button_remove_expense = ttk.Button(input_frame, text="Удалить траты", command=lambda car_id=car.id: self.remove_expense(car_id))
+        button_remove_expense.grid(row=1, column=2)
+
+        button_show_expenses_categ = ttk.Button(input_frame, text="Затраты по категориям", command=lambda car_id=car.id: self.show_chart(car_id, "categories"))
+        button_show_expenses_categ.grid(row=1, column=3)
+
+        button_show_expenses_categ = ttk.Button(input_frame, text="Затраты по годам",
+                                                command=lambda car_id=car.id: self.show_chart(car_id, "years"))
+        button_show_expenses_categ.grid(row=1, column=4)
+
+
+        button_export = ttk.Button(input_frame, text="Выгрузить",
+                                                command=lambda car=car: self.export_expenses([car.id], initial_file=f"{car.model} {car.year}.xlsx"))
+        button_export.grid(row=1, column=5)
+
+        button_import = ttk.Button(input_frame, text="Импорт из CSV",
+                                   command=lambda car_id=car.id: self.import_expenses(car_id))
+        button_import.grid(row=1, column=6)
+
+        # Фильтр таблицы по категории и удаление всех отфильтрованных трат
+        ttk.Label(input_frame, text="Категория:").grid(row=2, column=0, sticky="e", pady=(10, 0))
+        category_filter = ttk.Combobox(input_frame, state="readonly", values=[ALL_CATEGORIES] + EXPENSE_CATEGORIES)
+        category_filter.set(ALL_CATEGORIES)
+        category_filter.grid(row=2, column=1, columnspan=2, sticky="we", pady=(10, 0))
+        category_filter.bind("<<ComboboxSelected>>", lambda event, car_id=car.id: self.filter_expenses(car_id, event.widget.get()))
+
+        button_remove_filtered = ttk.Button(input_frame, text="Удалить отфильтрованные",
+                                            command=lambda car_id=car.id: self.remove_filtered_expenses(car_id))
+        button_remove_filtered.grid(row=2, column=3, pady=(10, 0))
+
+        # Полнотекстовый поиск по описанию и категории
+        ttk.Label(input_frame, text="Поиск:").grid(row=3, column=0, sticky="e", pady=(10, 0))
+        search_var = tk.StringVar()
+        search_entry = ttk.Entry(input_frame, textvariable=search_var)
+        search_entry.grid(row=3, column=1, columnspan=2, sticky="we", pady=(10, 0))
+        search_entry.bind("<Return>", lambda event, car_id=car.id: self.search_expenses(car_id, search_var.get()))
+        button_search = ttk.Button(input_frame, text="Найти",
+                                   command=lambda car_id=car.id: self.search_expenses(car_id, search_var.get()))
+        button_search.grid(row=3, column=3, pady=(10, 0))
+        button_search_reset = ttk.Button(input_frame, text="Сбросить",
+                                         command=lambda car_id=car.id: (search_var.set(""), self.search_expenses(car_id, "")))
+        button_search_reset.grid(row=3, column=4, pady=(10, 0))
+
+        button_show_monthly = ttk.Button(input_frame, text="Затраты по месяцам",
+                                         command=lambda car_id=car.id: self.show_chart(car_id, "monthly"))
+        button_show_monthly.grid(row=2, column=4, pady=(10, 0))
+        button_show_cost_curve = ttk.Button(input_frame, text="Руб/км по пробегу",
+                                            command=lambda car_id=car.id: self.show_chart(car_id, "cost_per_km"))
+        button_show_cost_curve.grid(row=2, column=5, pady=(10, 0))
+
+        # === Таблица операций ===
+        table_frame = ttk.LabelFrame(tab, text=" 📜 История операций ", padding=(10, 10))
+        table_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        # Создаём Treeview (таблицу)
+        columns = ("id", "amount", "category", "date", "mileage", "description")
+        tree = ttk.Treeview(table_frame, columns=columns, show="headings", height=12, selectmode="extended")
+        tree.config(displaycolumns=("amount", "category", "date", "mileage", "description"))
+
+        car_frame.update({
+            "heading": heading,
+            "tree": tree,
+            "category": None,
+            "search": None,
+            "built": True,
+        })
+
+        # Заголовки
+        tree.heading("amount", text="Сумма (RUB)")
+        tree.heading("category", text="Категория")
+        tree.heading("date", text="Дата")
+        tree.heading("mileage", text="Пробег (км)")
+        tree.heading("description", text="Описание")
+
+        # Ширина колонок
+        tree.column("amount", width=100, anchor="e")
+        tree.column("category", width=150)
+        tree.column("date", width=100, anchor="center")
+        tree.column("mileage", width=100, anchor="center")
+        tree.column("description", width=250)
+
+        # Полоса прокрутки
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=lambda first, last, car_id=car.id, scrollbar=scrollbar:
+                       self.on_tree_scroll(car_id, scrollbar, first, last))
+
+        # Размещение
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+    def show_car_tab(self, car_id):
+        """
+        Показывает данные А/М в его табе, при первом показе строит виджеты таба
+        """
+        if not self.cars_frames[car_id]['built']:
+            self.build_car_tab(car_id)
+        self.refresh_car_expenses_table(car_id)
 
     def remove_car(self, car_id):
         """
-        Удаляет А/М
+        Удаляет А/М и его таб, не затрагивая табы других А/М
         """
         delete_car(car_id)
-        self.refresh_cars_tabs()
+        tab = self.cars_frames.pop(car_id)['tab']
+        del self.tabs_cars[str(tab)]
+        self.tab_control.forget(tab)
+        tab.destroy()
 
     def on_car_select(self, event):
         """
         Обрабатывает событие выбора А/М (переключение табов)
         """
-        frame = event.widget.select()
-        current_tab_index = self.tab_control.index(frame)
-        for car_id, car_frame in self.cars_frames.items():
-            if self.tab_control.index(car_frame['tab']) == current_tab_index:
-                self.refresh_car_expenses_table(car_id)
+        car_id = self.tabs_cars.get(event.widget.select())
+        if car_id is not None:
+            self.show_car_tab(car_id)
 
     def remove_expense(self, car_id):
         """
-        Удаляет трату
+        Удаляет выбранные в таблице траты
         """
         current_tree = self.cars_frames[car_id]['tree']
         selected = current_tree.selection()
         if not selected:
             messagebox.showwarning("Ни одна трата не выбрана", "Сначала выберите трату")
             return
-        expense = current_tree.item(selected[0])
-        expense_id = expense['values'][0]
-        delete_expense(expense_id)
-        self.refresh_car_expenses_table(car_id)
\ No newline at end of file
+        if len(selected) > 1 and not messagebox.askyesno("Удаление трат", f"Удалить выбранные траты ({len(selected)})?"):
+            return
+        # Все выбранные траты удаляются одной транзакцией, таблица обновляется один раз после удаления
+        self.run_in_background(delete_expenses, [int(iid) for iid in selected],
+                               on_done=lambda deleted: self.delete_expense_rows(car_id, [row["id"] for row in deleted]))
+
+    def filter_expenses(self, car_id, category):
+        """
+        Показывает в таблице только траты выбранной категории
+        """
+        car_frame = self.cars_frames[car_id]
+        car_frame['category'] = None if category == ALL_CATEGORIES else category
+        self.refresh_car_expenses_table(car_id)
+
+    def search_expenses(self, car_id, text):
+        """
+        Показывает в таблице траты, найденные по словам в описании и категории; пустая строка - все траты
+        """
+        car_frame = self.cars_frames[car_id]
+        car_frame['search'] = text.strip() or None
+        self.refresh_car_expenses_table(car_id)
+
+    def remove_filtered_expenses(self, car_id):
+        """
+        Удаляет все траты А/М, показанные в таблице: подходящие под фильтр категории и строку поиска
+        """
+        category = self.cars_frames[car_id]['category']
+        search = self.cars_frames[car_id]['search']
+        if search is not None:
+            question = f"Удалить все траты, найденные по запросу «{search}»" + (f" в категории «{category}»?" if category is not None else "?")
+        elif category is not None:
+            question = f"Удалить все траты категории «{category}»?"
+        else:
+            question = "Фильтр не задан. Удалить все траты автомобиля?"
+        if not messagebox.askyesno("Удаление трат", question):
+            return
+        self.run_in_background(delete_filtered_expenses, car_id, category=category, search=search,
+                               on_done=lambda deleted: self.refresh_car_expenses_table(car_id) if car_id in self.cars_frames else None)
\ No newline at end of file
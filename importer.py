@@ -0,0 +1,90 @@
+# importer.py
+import argparse
+import csv
+from concurrent.futures import CancelledError
+from storage import init_storage, load_cars, save_expenses
+from utils import validate_amount, validate_date, validate_category
+
+# Колонки CSV-файла совпадают с колонками выгрузки расходов
+REQUIRED_COLUMNS = ("amount", "category", "date", "mileage")
+
+class ImportReport:
+    """
+    Результат импорта: количество сохранённых строк и отклонённые строки с номерами
+    """
+    def __init__(self):
+        self.imported = 0
+        self.rejected = []  # список пар (номер строки файла, текст ошибки)
+
+    def reject(self, line: int, error: str):
+        self.rejected.append((line, error))
+
+    def __repr__(self):
+        return f"Импортировано: {self.imported}, отклонено: {len(self.rejected)}"
+
+def read_expenses_csv(csv_file, report: ImportReport, car_id: int|None = None, delimiter: str = ",", cancel_event=None):
+    """
+    Построчно читает расходы из открытого CSV-файла и валидирует их.
+    Генератор: возвращает словари в формате Expense.to_dict, не накапливая строки в памяти.
+    Некорректные строки не прерывают чтение, а попадают в report.rejected с номером строки.
+    Если car_id не передан, ID А/М берётся из колонки car_id файла.
+    При установке cancel_event чтение прерывается исключением CancelledError
+    """
+    cars_mileage = {car.id: car.mileage for car in load_cars()}
+    reader = csv.DictReader(csv_file, delimiter=delimiter)
+    columns = REQUIRED_COLUMNS if car_id is not None else REQUIRED_COLUMNS + ("car_id",)
+    missing = [column for column in columns if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"В файле нет колонок: {', '.join(missing)}")
+
+    for row in reader:
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError("Импорт отменён")
+        try:
+            row_car_id = car_id if car_id is not None else int(row["car_id"])
+            if row_car_id not in cars_mileage:
+                raise ValueError(f"А/М с ID {row_car_id} не найден")
+            mileage = validate_amount(row["mileage"])
+            if mileage <= cars_mileage[row_car_id]:
+                raise ValueError("Пробег в момент траты не может быть меньше пробега на момент покупки а/м")
+            yield {
+                "car_id": row_car_id,
+                "amount": validate_amount(row["amount"]),
+                "date": validate_date(row["date"]),
+                "category": validate_category(row["category"]),
+                "description": (row.get("description") or "").strip(),
+                "mileage": mileage,
+            }
+        except (ValueError, TypeError) as e:
+            report.reject(reader.line_num, str(e))
+
+def import_expenses_csv(path: str, car_id: int|None = None, delimiter: str = ",", chunk_size: int = 1000,
+                        cancel_event=None) -> ImportReport:
+    """
+    Импортирует расходы из CSV-файла одной транзакцией, пачками по chunk_size строк.
+    При отмене через cancel_event транзакция откатывается целиком.
+    Возвращает ImportReport с количеством сохранённых и списком отклонённых строк
+    """
+    report = ImportReport()
+    # utf-8-sig: файлы, сохранённые из Excel, начинаются с BOM
+    with open(path, newline="", encoding="utf-8-sig") as csv_file:
+        expenses = read_expenses_csv(csv_file, report, car_id=car_id, delimiter=delimiter, cancel_event=cancel_event)
+        report.imported = save_expenses(expenses, chunk_size=chunk_size)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт расходов из CSV-файла")
+    parser.add_argument("path", help="путь к CSV-файлу")
+    parser.add_argument("--car-id", type=int, help="ID А/М; если не указан, берётся из колонки car_id")
+    parser.add_argument("--delimiter", default=",", help="разделитель колонок")
+    parser.add_argument("--db", help="путь к файлу БД")
+    args = parser.parse_args()
+
+    init_storage(args.db)
+    report = import_expenses_csv(args.path, car_id=args.car_id, delimiter=args.delimiter)
+    print(report)
+    for line, error in report.rejected:
+        print(f"Строка {line}: {error}")
+
+if __name__ == "__main__":
+    main()
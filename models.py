@@ -1,8 +1,12 @@
 # models.py
+from array import array
 from datetime import datetime
 import re
+from utils import validate_date
 
 class Expense:
+    __slots__ = ("id", "car_id", "amount", "category", "date", "description", "mileage")
+
     def __init__(
         self,
         id:int,
@@ -23,14 +27,25 @@ class Expense:
         self.description = description.strip()
         self.mileage = mileage
 
+    @classmethod
+    def from_db(cls, id: int, car_id: int, amount: float, category: str, date: str, description: str, mileage: float):
+        """
+        Создаёт объект из строки БД без повторной валидации: данные проверены при сохранении
+        """
+        expense = cls.__new__(cls)
+        expense.id = id
+        expense.car_id = car_id
+        expense.amount = amount
+        expense.category = category
+        expense.date = date
+        expense.description = description
+        expense.mileage = mileage
+        return expense
+
     @staticmethod
     def _validate_date(date_str: str) -> str:
-        """Принимает дату в формате YYYY-MM-DD"""
-        try:
-            datetime.strptime(date_str, "%Y-%m-%d")
-            return date_str
-        except ValueError:
-            raise ValueError("Date must be in YYYY-MM-DD format")
+        """Принимает дату строго в формате YYYY-MM-DD: в таком виде её принимает julianday() в БД"""
+        return validate_date(date_str)
 
     def to_dict(self):
         return {
@@ -45,7 +60,82 @@ class Expense:
     def __repr__(self):
         return f"Expense: {self.amount} RUB in '{self.category}' on {self.date}"
 
+class ExpenseBatch:
+    """
+    Колоночное представление расходов А/М без объекта на каждую строку:
+    id, суммы, пробеги и даты (номер дня от 1970-01-01) хранятся в компактных массивах array
+    """
+    __slots__ = ("car_id", "ids", "amounts", "mileages", "days", "categories")
+
+    def __init__(self, car_id: int, ids=(), amounts=(), mileages=(), days=(), categories=()):
+        self.car_id = car_id
+        self.ids = array("q", ids)
+        self.amounts = array("d", amounts)
+        self.mileages = array("d", mileages)
+        self.days = array("q", days)
+        self.categories = list(categories)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def total_amount(self) -> float:
+        return sum(self.amounts)
+
+    def max_mileage(self) -> float:
+        return max(self.mileages, default=0.0)
+
+    def to_numpy(self) -> dict:
+        """Возвращает колонки как массивы NumPy без копирования данных"""
+        import numpy as np
+        return {
+            "id": np.frombuffer(self.ids, dtype=np.int64),
+            "amount": np.frombuffer(self.amounts, dtype=np.float64),
+            "mileage": np.frombuffer(self.mileages, dtype=np.float64),
+            "day": np.frombuffer(self.days, dtype=np.int64),
+            "category": np.array(self.categories, dtype=object),
+        }
+
+    def __repr__(self):
+        return f"ExpenseBatch: {len(self)} expenses of car {self.car_id}"
+
+class CarStats:
+    """
+    Агрегаты расходов по А/М, которые БД поддерживает в актуальном состоянии
+    """
+    __slots__ = ("total_amount", "max_mileage", "expense_count", "first_date", "last_date")
+
+    def __init__(
+        self,
+        total_amount: float = 0.0,
+        max_mileage: float = 0.0,
+        expense_count: int = 0,
+        first_date: str|None = None,
+        last_date: str|None = None,
+    ):
+        self.total_amount = total_amount
+        self.max_mileage = max_mileage
+        self.expense_count = expense_count
+        self.first_date = first_date
+        self.last_date = last_date
+
+    def cost_per_km(self, start_mileage: float) -> float:
+        """Стоимость содержания в рублях на километр (руб/км) от пробега start_mileage"""
+        return self.total_amount / (self.max_mileage - start_mileage)
+
+    def add(self, expense: "Expense"):
+        """Учитывает в агрегатах новый расход без обращения к БД"""
+        self.total_amount += expense.amount
+        self.max_mileage = max(self.max_mileage, expense.mileage) if self.expense_count else expense.mileage
+        self.first_date = min(self.first_date, expense.date) if self.first_date else expense.date
+        self.last_date = max(self.last_date, expense.date) if self.last_date else expense.date
+        self.expense_count += 1
+
+    def __repr__(self):
+        return f"CarStats: {self.total_amount} RUB, {self.expense_count} expenses, up to {self.max_mileage} km"
+
 class Car:
+    __slots__ = ("id", "model", "year", "mileage", "price", "expenses", "stats")
+
     def __init__(
         self,
         id: int,
@@ -60,6 +150,7 @@ class Car:
         self.mileage = mileage
         self.price = price
         self.expenses = []
+        self.stats = None
 
     def to_dict(self):
         return {
@@ -71,7 +162,16 @@ class Car:
         }
 
     def calculate_expense(self):
-        """Высчитывает стоимость содержания в рублях на километр (руб/км)"""
+        """
+        Высчитывает стоимость содержания в рублях на километр (руб/км).
+        Если загружены агрегаты из БД (stats) или расходы в виде ExpenseBatch,
+        отдельные объекты расходов не перебираются
+        """
+        if self.stats is not None:
+            return self.stats.cost_per_km(self.mileage)
+        if isinstance(self.expenses, ExpenseBatch):
+            return self.expenses.total_amount() / (self.expenses.max_mileage() - self.mileage)
+
         current_mileage = sum_amount = 0
         for expense in self.expenses:
             sum_amount += expense.amount
@@ -82,7 +182,8 @@ class Car:
 
     def __repr__(self):
         car_repr = f"А/М: {self.model} {self.year} г. \nПробег на момент покупки: {self.mileage:.1f} км"
-        if self.expenses:
+        has_expenses = self.stats.expense_count > 0 if self.stats is not None else bool(self.expenses)
+        if has_expenses:
             car_repr += f"\nСтоимость содержания: {self.calculate_expense():.2f} руб/км"
         return car_repr
 
@@ -0,0 +1,203 @@
+# profiling.py
+import atexit
+import functools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Замеры включаются переменной окружения CAR_EXPENSES_PROFILE: её значение - путь к JSON-отчёту,
+# который записывается при выходе ("1" - файл profile.json в текущей папке).
+# Порог медленной операции в миллисекундах задаётся CAR_EXPENSES_SLOW_MS
+PROFILE_ENV = "CAR_EXPENSES_PROFILE"
+SLOW_MS_ENV = "CAR_EXPENSES_SLOW_MS"
+DEFAULT_REPORT = "profile.json"
+DEFAULT_SLOW_MS = 100.0
+
+# Верхние границы корзин гистограммы длительностей, мс; последняя корзина - всё, что дольше
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# Сколько медленных операций и SQL-запросов одной операции хранить
+SLOW_LOG_SIZE = 200
+MAX_QUERIES = 10
+
+_enabled = False
+_report_path = None
+_slow_ms = DEFAULT_SLOW_MS
+_stats = {}  # название операции -> OperationStats
+_slow_log = deque(maxlen=SLOW_LOG_SIZE)
+_lock = threading.Lock()
+_local = threading.local()
+_started = None
+
+class OperationStats:
+    """
+    Накопленные замеры одной операции: количество, суммарное и максимальное время, гистограмма
+    """
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms: float, rows: int|None):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.rows += rows or 0
+        self.buckets[bisect_left(BUCKETS_MS, ms)] += 1
+
+    def percentile(self, share: float) -> float:
+        """Оценка перцентиля по гистограмме: верхняя граница корзины, в которую он попадает"""
+        needed = share * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (self.max_ms,), self.buckets):
+            seen += count
+            if seen >= needed:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        labels = [f"<={bound}" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "histogram_ms": dict(zip(labels, self.buckets)),
+        }
+
+def enabled() -> bool:
+    return _enabled
+
+def enable(report_path: str|None = DEFAULT_REPORT, slow_ms: float = DEFAULT_SLOW_MS):
+    """
+    Включает замеры. Отчёт записывается в report_path при выходе из программы (None - не записывать).
+    SQL-запросы записываются для соединений, открытых после включения, поэтому
+    включать замеры нужно до init_storage
+    """
+    global _enabled, _report_path, _slow_ms, _started
+    if _report_path is None and report_path is not None:
+        atexit.register(dump)
+    _enabled = True
+    _report_path = report_path
+    _slow_ms = slow_ms
+    _started = _started or time.strftime("%Y-%m-%dT%H:%M:%S")
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def reset():
+    """
+    Очищает накопленные замеры
+    """
+    with _lock:
+        _stats.clear()
+        _slow_log.clear()
+
+def _row_count(result, returns_count: bool):
+    if returns_count:
+        return result
+    if isinstance(result, sqlite3.Row):
+        return 1
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+def record(name: str, ms: float, rows: int|None = None, queries=()):
+    """
+    Учитывает замер операции name в гистограмме и, если она дольше порога, в журнале медленных операций
+    """
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = OperationStats()
+        stats.add(ms, rows)
+        if ms >= _slow_ms:
+            _slow_log.append({
+                "name": name,
+                "ms": round(ms, 3),
+                "rows": rows,
+                "queries": list(queries),
+                "thread": threading.current_thread().name,
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            })
+    if ms >= _slow_ms:
+        print(f"Медленная операция {name}: {ms:.1f} мс", file=sys.stderr)
+
+def timed(func=None, *, name: str = None, returns_count: bool = False):
+    """
+    Декоратор замера длительности функции. Пока замеры выключены, добавляет к вызову одну проверку флага.
+    Длина результата учитывается как количество строк; returns_count = True - функция сама возвращает количество
+    """
+    if func is None:
+        return functools.partial(timed, name=name, returns_count=returns_count)
+    name = name or f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        # Стек операций потока: SQL-запросы относятся к самой вложенной операции
+        stack = _local.__dict__.setdefault("stack", [])
+        queries = []
+        stack.append(queries)
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            stack.pop()
+        record(name, ms, _row_count(result, returns_count), queries)
+        return result
+    return wrapper
+
+def trace_sql(statement: str):
+    """
+    Обработчик sqlite3 set_trace_callback: запоминает текст запроса для текущей операции
+    """
+    stack = getattr(_local, "stack", None)
+    if stack and len(stack[-1]) < MAX_QUERIES:
+        stack[-1].append(" ".join(statement.split()))
+
+def report() -> dict:
+    """
+    Возвращает отчёт по замерам: гистограммы операций (по убыванию суммарного времени) и медленные операции
+    """
+    with _lock:
+        operations = sorted(_stats.items(), key=lambda item: item[1].total_ms, reverse=True)
+        return {
+            "started": _started,
+            "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "slow_threshold_ms": _slow_ms,
+            "operations": {name: stats.to_dict() for name, stats in operations},
+            "slow": list(_slow_log),
+        }
+
+def dump(path: str|None = None):
+    """
+    Записывает отчёт по замерам в JSON-файл (по умолчанию - путь, переданный в enable)
+    """
+    path = path or _report_path
+    if path is None:
+        return
+    try:
+        with open(path, "w", encoding="utf-8") as report_file:
+            json.dump(report(), report_file, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"Ошибка при сохранении отчёта о замерах: {e}")
+
+if os.environ.get(PROFILE_ENV):
+    _path = os.environ[PROFILE_ENV]
+    enable(DEFAULT_REPORT if _path == "1" else _path, float(os.environ.get(SLOW_MS_ENV, DEFAULT_SLOW_MS)))
@@ -0,0 +1,324 @@
+# server.py
+import argparse
+import asyncio
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qsl
+import cost_index
+import storage
+from models import Expense, Car
+from utils import validate_category
+
+# Потоки для блокирующих запросов чтения к SQLite
+READ_WORKERS = 8
+# Сколько запросов записи из очереди фиксируются одной транзакцией
+MAX_BATCH_REQUESTS = 1000
+# Ограничения запроса: размер заголовков и тела, ожидание следующего запроса keep-alive, секунды
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 15
+# Границы размера страницы расходов: limit = -1 в SQLite означает "без ограничения"
+MAX_PAGE_LIMIT = 1000
+
+class HttpError(Exception):
+    """
+    Ошибка обработки запроса с HTTP-статусом ответа
+    """
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _expense_dict(expense) -> dict:
+    return {"id": expense.id, **expense.to_dict()}
+
+def _car_dict(car) -> dict:
+    stats = car.stats
+    return {
+        **car.to_dict(),
+        "total_amount": stats.total_amount,
+        "max_mileage": stats.max_mileage,
+        "expense_count": stats.expense_count,
+        "first_date": stats.first_date,
+        "last_date": stats.last_date,
+        "cost_per_km": car.calculate_expense() if stats.expense_count else None,
+    }
+
+def _float_param(query: dict, name: str):
+    value = query.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"Параметр {name} должен быть числом")
+
+class ApiServer:
+    """
+    Локальный HTTP/JSON API над storage на asyncio: запросы чтения выполняются в ограниченном пуле потоков,
+    все записи выполняются через storage.GroupCommitter, который фиксирует запросы, пришедшие
+    в пределах окна write_window секунд, одной транзакцией (каждый запрос - в своей точке сохранения)
+    """
+    def __init__(self, read_workers: int = READ_WORKERS, write_window: float = storage.GROUP_COMMIT_WINDOW,
+                 max_batch_requests: int = MAX_BATCH_REQUESTS):
+        self.writer = storage.GroupCommitter(write_window, max_batch_requests)
+        self._executor = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="reader")
+        self._server = None
+        self.routes = [
+            ("GET", r"/cars", self.get_cars),
+            ("POST", r"/cars", self.post_car),
+            ("GET", r"/cars/(\d+)", self.get_car),
+            ("DELETE", r"/cars/(\d+)", self.delete_car),
+            ("GET", r"/cars/(\d+)/expenses", self.get_expenses),
+            ("POST", r"/cars/(\d+)/expenses", self.post_expenses),
+            ("DELETE", r"/cars/(\d+)/expenses", self.delete_expenses),
+            ("GET", r"/cars/(\d+)/categories", self.get_categories),
+            ("GET", r"/cars/(\d+)/years", self.get_years),
+            ("GET", r"/cars/(\d+)/cost-per-km", self.get_cost_per_km),
+            ("GET", r"/fleet/summary", self.get_fleet_summary),
+        ]
+        self.routes = [(method, re.compile(pattern), handler) for method, pattern, handler in self.routes]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> int:
+        """
+        Запускает сервер; port = 0 - свободный порт
+        Возвращает номер порта
+        """
+        self._server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await asyncio.to_thread(self.writer.close)
+        self._executor.shutdown(wait=True)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Выполняет блокирующую функцию storage в пуле потоков чтения
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def write(self, fn, *args, **kwargs):
+        """
+        Выполняет функцию записи storage через писателя с группировкой транзакций
+        Возвращает результат функции после фиксации транзакции
+        """
+        return await asyncio.wrap_future(self.writer.submit(fn, *args, **kwargs))
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ")
+                except ValueError:
+                    await self.send(writer, HTTPStatus.BAD_REQUEST, {"error": "Некорректная строка запроса"}, False)
+                    break
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              if version == "HTTP/1.1" else headers.get("connection", "").lower() == "keep-alive")
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    await self.send(writer, HTTPStatus.BAD_REQUEST, {"error": "Некорректный Content-Length"}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.send(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Слишком большой запрос"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(method, target, body)
+                await self.send(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, status: HTTPStatus, payload, keep_alive: bool):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def dispatch(self, method: str, target: str, body: bytes):
+        """
+        Находит обработчик по методу и пути и возвращает пару (статус, данные ответа)
+        """
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        path_matched = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(url.path)
+            if match is None:
+                continue
+            path_matched = True
+            if route_method != method:
+                continue
+            try:
+                data = json.loads(body) if body else None
+                args = [int(group) for group in match.groups()]
+                return await handler(*args, query=query, data=data)
+            except HttpError as e:
+                return e.status, {"error": str(e)}
+            except (ValueError, TypeError, KeyError) as e:
+                return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+            except Exception as e:
+                print(f"Ошибка при обработке запроса {method} {url.path}: {e}")
+                return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Внутренняя ошибка сервера"}
+        if path_matched:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"Метод {method} не поддерживается"}
+        return HTTPStatus.NOT_FOUND, {"error": "Не найдено"}
+
+    async def load_car(self, car_id: int):
+        car = await self.run(storage.load_car, car_id)
+        if car is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"А/М с ID {car_id} не найден")
+        return car
+
+    async def get_cars(self, query, data):
+        return HTTPStatus.OK, [_car_dict(car) for car in await self.run(storage.load_cars)]
+
+    async def post_car(self, query, data):
+        car = Car(id=0, model=data["model"], year=data["year"], mileage=float(data["mileage"]), price=float(data["price"]))
+        car_id = await self.write(storage.save_car, car)
+        if car_id is None:
+            raise HttpError(HTTPStatus.INTERNAL_SERVER_ERROR, "А/М не сохранён")
+        return HTTPStatus.CREATED, {"id": car_id}
+
+    async def get_car(self, car_id, query, data):
+        return HTTPStatus.OK, _car_dict(await self.load_car(car_id))
+
+    async def delete_car(self, car_id, query, data):
+        await self.load_car(car_id)
+        await self.write(storage.delete_car, car_id)
+        return HTTPStatus.OK, {"deleted": car_id}
+
+    async def get_expenses(self, car_id, query, data):
+        """
+        Без дат - страница по ключу (пробег, id): before_mileage и before_id, limit, category;
+        с date_from и/или date_to - все расходы за период по возрастанию даты
+        """
+        await self.load_car(car_id)
+        if "date_from" in query or "date_to" in query:
+            expenses = await self.run(storage.load_expenses_between, car_id, query.get("date_from"), query.get("date_to"))
+        else:
+            before = None
+            if "before_mileage" in query:
+                before = (_float_param(query, "before_mileage"), int(query.get("before_id", 2 ** 63 - 1)))
+            expenses = await self.run(storage.load_expenses_page, car_id, before=before,
+                                      limit=max(1, min(int(query.get("limit", 100)), MAX_PAGE_LIMIT)), category=query.get("category"))
+        return HTTPStatus.OK, [_expense_dict(expense) for expense in expenses]
+
+    async def post_expenses(self, car_id, query, data):
+        """
+        Принимает один расход или список расходов; все строки запроса сохраняются вместе
+        """
+        car = await self.load_car(car_id)
+        items = data if isinstance(data, list) else [data]
+        rows = []
+        for number, item in enumerate(items):
+            try:
+                expense = Expense(id=0, car_id=car_id, amount=float(item["amount"]),
+                                  category=validate_category(item["category"]), date=item["date"],
+                                  mileage=float(item["mileage"]), description=item.get("description") or "")
+            except (ValueError, TypeError, KeyError) as e:
+                raise HttpError(HTTPStatus.BAD_REQUEST, f"Расход {number}: {e}")
+            if expense.mileage <= car.mileage:
+                raise HttpError(HTTPStatus.BAD_REQUEST,
+                                f"Расход {number}: пробег в момент траты не может быть меньше пробега на момент покупки а/м")
+            rows.append(expense.to_dict())
+        return HTTPStatus.CREATED, {"inserted": await self.write(storage.save_expenses, rows)}
+
+    async def delete_expenses(self, car_id, query, data):
+        """
+        Удаляет расходы по списку id из тела запроса ({"ids": [...]}) либо все расходы категории (?category=)
+        """
+        await self.load_car(car_id)
+        if data and "ids" in data:
+            deleted = await self.write(storage.delete_expenses, [int(expense_id) for expense_id in data["ids"]], car_id=car_id)
+            return HTTPStatus.OK, {"deleted": len(deleted)}
+        if "category" not in query:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Передайте ids в теле запроса или параметр category")
+        return HTTPStatus.OK, {"deleted": await self.write(storage.delete_filtered_expenses, car_id, category=query["category"])}
+
+    def _filters(self, query):
+        return {
+            "date_from": query.get("date_from"),
+            "date_to": query.get("date_to"),
+            "mileage_from": _float_param(query, "mileage_from"),
+            "mileage_to": _float_param(query, "mileage_to"),
+        }
+
+    async def get_categories(self, car_id, query, data):
+        rows = await self.run(storage.sum_expenses_by_category, car_id, **self._filters(query))
+        return HTTPStatus.OK, [dict(row) for row in rows]
+
+    async def get_years(self, car_id, query, data):
+        rows = await self.run(storage.sum_expenses_by_year, car_id, **self._filters(query))
+        return HTTPStatus.OK, [dict(row) for row in rows]
+
+    async def get_cost_per_km(self, car_id, query, data):
+        """
+        Стоимость километра по индексу накопленных сумм: за последние last_km км,
+        в окне mileage_from..mileage_to, за период date_from..date_to либо за всё время
+        """
+        car = await self.load_car(car_id)
+        index = await self.run(cost_index.get_cost_index, car)
+        filters = self._filters(query)
+        if "last_km" in query:
+            value = index.last_km(_float_param(query, "last_km"))
+        else:
+            value = index.cost_per_km(**filters)
+        return HTTPStatus.OK, {"car_id": car_id, "cost_per_km": value, **filters}
+
+    async def get_fleet_summary(self, query, data):
+        return HTTPStatus.OK, [dict(row) for row in await self.run(storage.load_fleet_summary)]
+
+async def serve(host: str, port: int, read_workers: int = READ_WORKERS):
+    server = ApiServer(read_workers=read_workers)
+    port = await server.start(host, port)
+    print(f"API доступен по адресу http://{host}:{port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный HTTP/JSON API учёта расходов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", help="путь к файлу БД")
+    parser.add_argument("--workers", type=int, default=READ_WORKERS, help="потоков для запросов чтения")
+    args = parser.parse_args()
+
+    storage.init_storage(args.db)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,222 @@
 # storage.py
+import contextlib
 import os
-from models import Expense, Car
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from models import Expense, ExpenseBatch, Car, CarStats
 import sqlite3
+import cache
+import profiling
+from utils import to_day, from_day
 
 # Путь к файлу данных
 DATA_DIR = "data"
 DB_FILE = os.path.join(DATA_DIR, "app.db")
-conn = sqlite3.connect(DB_FILE)
-conn.row_factory = sqlite3.Row
-cur = conn.cursor()
 
-def init_storage():
+# Время ожидания блокировки БД другим писателем, секунды
+BUSY_TIMEOUT = 10.0
+# Настройки соединения: WAL позволяет читать БД одновременно с записью,
+# synchronous = NORMAL в режиме WAL не теряет целостность при сбое приложения
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # 16 МБ
+    "PRAGMA mmap_size = 268435456",  # 256 МБ
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+)
+
+# Окно группировки записей GroupCommitter, секунды, и наибольшее число записей в одной транзакции
+GROUP_COMMIT_WINDOW = 0.005
+GROUP_COMMIT_MAX_JOBS = 1000
+
+# Соединения открываются по одному на поток (интерфейс, фоновые задачи, отчёты).
+# Поколение увеличивается при закрытии соединений: поток, чьё соединение открыто в прошлом поколении,
+# открывает новое, даже если файл БД тот же
+_db_file = None
+_generation = 0
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
+def connect(db_file:str):
     """
-    Создаёт папку 'data', если она не существует.
-    Создает таблицы БД, если не существуют
+    Открывает и настраивает новое соединение с БД.
+    Транзакции управляются явно (isolation_level = None), см. transaction
+    """
+    connection = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    connection.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        connection.execute(pragma)
+    if profiling.enabled():
+        connection.set_trace_callback(profiling.trace_sql)
+    return connection
+
+def get_connection():
+    """
+    Возвращает соединение текущего потока, при первом обращении открывает его
+    """
+    connection = getattr(_local, "connection", None)
+    if connection is None or _local.generation != _generation:
+        if _db_file is None:
+            raise RuntimeError("Хранилище не инициализировано, вызовите init_storage()")
+        connection = connect(_db_file)
+        _local.connection = connection
+        _local.generation = _generation
+        with _connections_lock:
+            _connections.append(connection)
+    return connection
+
+def close_connections():
+    """
+    Закрывает соединения всех потоков; другие потоки откроют новые при следующем обращении
+    """
+    global _generation
+    with _connections_lock:
+        for connection in _connections:
+            connection.close()
+        _connections.clear()
+        _generation += 1
+    _local.__dict__.clear()
+
+def in_transaction() -> bool:
+    """
+    Открыта ли в текущем потоке транзакция transaction()
+    """
+    return getattr(_local, "depth", 0) > 0
+
+@contextlib.contextmanager
+def transaction():
+    """
+    Единица работы: все записи внутри блока фиксируются одной транзакцией соединения текущего потока
+    и откатываются целиком при исключении. Вложенные блоки выполняются в точках сохранения (SAVEPOINT):
+    исключение внутри вложенного блока откатывает только его.
+    BEGIN IMMEDIATE сразу захватывает блокировку записи, поэтому параллельные писатели
+    ждут друг друга (до BUSY_TIMEOUT), а не получают "database is locked" посреди транзакции.
+    Сброс кеша и уведомления подписчиков откладываются до фиксации внешней транзакции
     """
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
+    connection = get_connection()
+    depth = getattr(_local, "depth", 0)
+    if depth == 0:
+        connection.execute("BEGIN IMMEDIATE")
+        _local.after_commit = []
+    else:
+        connection.execute(f"SAVEPOINT level{depth}")
+    mark = len(_local.after_commit)
+    _local.depth = depth + 1
+    try:
+        yield connection
+        if depth == 0:
+            connection.execute("COMMIT")
+            _count_commit()
+        else:
+            connection.execute(f"RELEASE level{depth}")
+    except BaseException:
+        if depth == 0:
+            connection.execute("ROLLBACK")
+        else:
+            connection.execute(f"ROLLBACK TO level{depth}")
+            connection.execute(f"RELEASE level{depth}")
+        del _local.after_commit[mark:]
+        raise
+    finally:
+        _local.depth = depth
+    if depth == 0:
+        callbacks = _local.after_commit
+        _local.after_commit = []
+        for callback in callbacks:
+            callback()
 
-    cur.execute('''
+# Число транзакций, зафиксированных соединениями этого процесса (см. check_external_changes)
+_commits = 0
+_commits_lock = threading.Lock()
+
+def _count_commit():
+    global _commits
+    with _commits_lock:
+        _commits += 1
+
+def check_external_changes() -> bool:
+    """
+    Проверяет по PRAGMA data_version соединения текущего потока, фиксировали ли транзакции
+    другие процессы (API-сервер, импорт, cli). Если да, помечает устаревшими кеш и индексы всех А/М
+    (cache.bump_all и уведомление "reset"). data_version меняется и от записей других потоков
+    этого процесса: изменение, за время которого процесс сам фиксировал транзакции, считается своим -
+    кеш по нему уже сброшен самой записью
+    Возвращает True, если обнаружены изменения другими процессами
+    """
+    if _db_file is None:
+        return False
+    commits = _commits
+    try:
+        connection = get_connection()
+        version = connection.execute("PRAGMA data_version").fetchone()[0]
+    except sqlite3.Error:
+        # Проверка не должна мешать чтению из кеша; недоступная БД даст ошибку в самом запросе
+        return False
+    seen = getattr(_local, "seen", None)
+    _local.seen = (connection, version, commits)
+    if seen is None or seen[0] is not connection or seen[1] == version or seen[2] != commits:
+        return False
+    cache.bump_all()
+    _notify("reset", None)
+    return True
+
+def _after_commit(callback):
+    """
+    Выполняет callback после фиксации внешней транзакции, вне транзакции - сразу
+    """
+    if in_transaction():
+        _local.after_commit.append(callback)
+    else:
+        callback()
+
+def _changed(car_id:int, event:str|None = None, rows=()):
+    """
+    Отмечает изменение данных А/М: сбрасывает его кеш и уведомляет подписчиков после фиксации
+    """
+    def callback():
+        cache.bump_version(car_id)
+        if event is not None:
+            _notify(event, car_id, rows)
+    _after_commit(callback)
+
+# Подписчики на изменения расходов: функции listener(event, car_id, rows), вызываются после фиксации транзакции.
+# event - "insert" или "delete" с изменёнными строками (id, amount, mileage, day) либо "reset",
+# когда изменения массовые и производные данные А/М (car_id = None - всех А/М) нужно перестроить
+_listeners = []
+
+def add_listener(listener):
+    """
+    Подписывает функцию на уведомления об изменении расходов
+    """
+    _listeners.append(listener)
+
+def _notify(event:str, car_id:int|None, rows=()):
+    for listener in _listeners:
+        try:
+            listener(event, car_id, rows)
+        except Exception as e:
+            print(f"Ошибка при обработке изменения данных: {e}")
+
+cache.set_change_check(check_external_changes)
+
+# Миграции схемы БД. Номер миграции - её позиция в списке (начиная с 1),
+# номер последней применённой миграции хранится в PRAGMA user_version.
+# Уже выпущенные миграции не меняются, новые добавляются в конец списка.
+MIGRATIONS = [
+    # 1. Исходная схема
+    '''
     CREATE TABLE IF NOT EXISTS cars (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         model TEXT,
         year INTEGER,
         mileage REAL,
         price REAL
-    )
-    ''')
-
-    cur.execute('''
+    );
     CREATE TABLE IF NOT EXISTS expenses (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         car_id INTEGER,
@@ -37,23 +225,310 @@ def init_storage():
         description TEXT,
         category TEXT,
         mileage REAL
-    )
-    ''')
+    );
+    ''',
+    # 2. Внешний ключ expenses.car_id с каскадным удалением.
+    # SQLite не умеет добавлять ограничения в существующую таблицу,
+    # поэтому таблица пересоздаётся; осиротевшие расходы не переносятся.
+    '''
+    CREATE TABLE expenses_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        car_id INTEGER NOT NULL REFERENCES cars (id) ON DELETE CASCADE,
+        amount REAL,
+        date TEXT,
+        description TEXT,
+        category TEXT,
+        mileage REAL
+    );
+    INSERT INTO expenses_new (id, car_id, amount, date, description, category, mileage)
+        SELECT id, car_id, amount, date, description, category, mileage FROM expenses
+        WHERE car_id IN (SELECT id FROM cars);
+    DROP TABLE expenses;
+    ALTER TABLE expenses_new RENAME TO expenses;
+    ''',
+    # 3. Индексы для выборок расходов по А/М
+    '''
+    CREATE INDEX IF NOT EXISTS idx_expenses_car_mileage ON expenses (car_id, mileage);
+    CREATE INDEX IF NOT EXISTS idx_expenses_car_date ON expenses (car_id, date);
+    ''',
+    # 4. Агрегаты расходов по А/М, поддерживаемые триггерами в той же транзакции,
+    # что и изменение expenses. Строка удаляется, когда у А/М не остаётся расходов.
+    # Пересчёт максимумов при удалении идёт по индексам (car_id, mileage) и (car_id, date)
+    '''
+    CREATE TABLE car_stats (
+        car_id INTEGER PRIMARY KEY REFERENCES cars (id) ON DELETE CASCADE,
+        total_amount REAL NOT NULL,
+        max_mileage REAL NOT NULL,
+        expense_count INTEGER NOT NULL,
+        first_date TEXT,
+        last_date TEXT
+    );
+    INSERT INTO car_stats (car_id, total_amount, max_mileage, expense_count, first_date, last_date)
+        SELECT car_id, SUM(amount), MAX(mileage), COUNT(*), MIN(date), MAX(date) FROM expenses GROUP BY car_id;
+    CREATE TRIGGER expenses_stats_insert AFTER INSERT ON expenses BEGIN
+        INSERT INTO car_stats (car_id, total_amount, max_mileage, expense_count, first_date, last_date)
+            VALUES (new.car_id, new.amount, new.mileage, 1, new.date, new.date)
+            ON CONFLICT (car_id) DO UPDATE SET
+                total_amount = total_amount + excluded.total_amount,
+                max_mileage = MAX(max_mileage, excluded.max_mileage),
+                expense_count = expense_count + 1,
+                first_date = MIN(first_date, excluded.first_date),
+                last_date = MAX(last_date, excluded.last_date);
+    END;
+    CREATE TRIGGER expenses_stats_delete AFTER DELETE ON expenses BEGIN
+        UPDATE car_stats SET
+            total_amount = total_amount - old.amount,
+            expense_count = expense_count - 1,
+            max_mileage = CASE WHEN old.mileage < max_mileage THEN max_mileage
+                ELSE COALESCE((SELECT MAX(mileage) FROM expenses WHERE car_id = old.car_id), 0) END,
+            first_date = CASE WHEN old.date > first_date THEN first_date
+                ELSE (SELECT MIN(date) FROM expenses WHERE car_id = old.car_id) END,
+            last_date = CASE WHEN old.date < last_date THEN last_date
+                ELSE (SELECT MAX(date) FROM expenses WHERE car_id = old.car_id) END
+        WHERE car_id = old.car_id;
+        DELETE FROM car_stats WHERE car_id = old.car_id AND expense_count <= 0;
+    END;
+    ''',
+    # 5. Дата расхода хранится номером дня от 1970-01-01 (day) с индексом (car_id, day),
+    # строка YYYY-MM-DD остаётся вычисляемой колонкой date для чтения.
+    # Таблица пересоздаётся, поэтому триггеры car_stats и индексы создаются заново;
+    # минимум и максимум даты при удалении ищутся по индексу (car_id, day).
+    # Старые даты без ведущих нулей (2025-1-5) приводятся к YYYY-MM-DD; строки с датой, которую не удалось
+    # разобрать, не переносятся, а сохраняются в expenses_invalid_date, и car_stats пересчитывается без них
+    '''
+    CREATE TEMP TABLE expense_days AS
+        WITH parts AS (SELECT id, date, substr(date, instr(date, '-') + 1) AS rest FROM expenses)
+        SELECT id, CAST(COALESCE(julianday(date),
+                                 julianday(printf('%04d-%02d-%02d', CAST(date AS INTEGER), CAST(rest AS INTEGER),
+                                                  CAST(substr(rest, instr(rest, '-') + 1) AS INTEGER))))
+                        - 2440587.5 AS INTEGER) AS day
+        FROM parts;
+    CREATE TABLE expenses_invalid_date AS
+        SELECT expenses.* FROM expenses JOIN expense_days USING (id) WHERE expense_days.day IS NULL;
+    CREATE TABLE expenses_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        car_id INTEGER NOT NULL REFERENCES cars (id) ON DELETE CASCADE,
+        amount REAL,
+        day INTEGER NOT NULL,
+        date TEXT GENERATED ALWAYS AS (date(day * 86400, 'unixepoch')) VIRTUAL,
+        description TEXT,
+        category TEXT,
+        mileage REAL
+    );
+    INSERT INTO expenses_new (id, car_id, amount, day, description, category, mileage)
+        SELECT id, car_id, amount, expense_days.day, description, category, mileage
+        FROM expenses JOIN expense_days USING (id) WHERE expense_days.day IS NOT NULL;
+    DROP TABLE expense_days;
+    DROP TABLE expenses;
+    ALTER TABLE expenses_new RENAME TO expenses;
+    DELETE FROM car_stats;
+    INSERT INTO car_stats (car_id, total_amount, max_mileage, expense_count, first_date, last_date)
+        SELECT car_id, SUM(amount), MAX(mileage), COUNT(*), date(MIN(day) * 86400, 'unixepoch'), date(MAX(day) * 86400, 'unixepoch')
+        FROM expenses GROUP BY car_id;
+    CREATE INDEX idx_expenses_car_mileage ON expenses (car_id, mileage);
+    CREATE INDEX idx_expenses_car_day ON expenses (car_id, day);
+    CREATE TRIGGER expenses_stats_insert AFTER INSERT ON expenses BEGIN
+        INSERT INTO car_stats (car_id, total_amount, max_mileage, expense_count, first_date, last_date)
+            VALUES (new.car_id, new.amount, new.mileage, 1, new.date, new.date)
+            ON CONFLICT (car_id) DO UPDATE SET
+                total_amount = total_amount + excluded.total_amount,
+                max_mileage = MAX(max_mileage, excluded.max_mileage),
+                expense_count = expense_count + 1,
+                first_date = MIN(first_date, excluded.first_date),
+                last_date = MAX(last_date, excluded.last_date);
+    END;
+    CREATE TRIGGER expenses_stats_delete AFTER DELETE ON expenses BEGIN
+        UPDATE car_stats SET
+            total_amount = total_amount - old.amount,
+            expense_count = expense_count - 1,
+            max_mileage = CASE WHEN old.mileage < max_mileage THEN max_mileage
+                ELSE COALESCE((SELECT MAX(mileage) FROM expenses WHERE car_id = old.car_id), 0) END,
+            first_date = CASE WHEN old.date > first_date THEN first_date
+                ELSE (SELECT date(MIN(day) * 86400, 'unixepoch') FROM expenses WHERE car_id = old.car_id) END,
+            last_date = CASE WHEN old.date < last_date THEN last_date
+                ELSE (SELECT date(MAX(day) * 86400, 'unixepoch') FROM expenses WHERE car_id = old.car_id) END
+        WHERE car_id = old.car_id;
+        DELETE FROM car_stats WHERE car_id = old.car_id AND expense_count <= 0;
+    END;
+    ''',
+    # 6. Полнотекстовый индекс FTS5 по описанию и категории расходов. Индекс хранит только токены
+    # (content = expenses), текст читается из самой таблицы; синхронизация - триггерами
+    '''
+    CREATE VIRTUAL TABLE expenses_fts USING fts5 (
+        description, category,
+        content = 'expenses', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild');
+    CREATE TRIGGER expenses_fts_insert AFTER INSERT ON expenses BEGIN
+        INSERT INTO expenses_fts (rowid, description, category) VALUES (new.id, new.description, new.category);
+    END;
+    CREATE TRIGGER expenses_fts_delete AFTER DELETE ON expenses BEGIN
+        INSERT INTO expenses_fts (expenses_fts, rowid, description, category) VALUES ('delete', old.id, old.description, old.category);
+    END;
+    CREATE TRIGGER expenses_fts_update AFTER UPDATE OF description, category ON expenses BEGIN
+        INSERT INTO expenses_fts (expenses_fts, rowid, description, category) VALUES ('delete', old.id, old.description, old.category);
+        INSERT INTO expenses_fts (rowid, description, category) VALUES (new.id, new.description, new.category);
+    END;
+    ''',
+    # 7. Месячные итоги расходов по А/М и категориям (month - строка YYYY-MM, категория NULL хранится как ''),
+    # поддерживаемые триггерами. Отчёты по месяцам, годам и категориям читают их вместо строк расходов.
+    # Минимум и максимум пробега при удалении пересчитываются по индексу (car_id, day) в пределах месяца
+    '''
+    CREATE TABLE expense_rollups (
+        car_id INTEGER NOT NULL REFERENCES cars (id) ON DELETE CASCADE,
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        min_mileage REAL,
+        max_mileage REAL,
+        PRIMARY KEY (car_id, month, category)
+    ) WITHOUT ROWID;
+    INSERT INTO expense_rollups (car_id, month, category, total, count, min_mileage, max_mileage)
+        SELECT car_id, strftime('%Y-%m', day * 86400, 'unixepoch') AS month, COALESCE(category, '') AS category,
+               SUM(amount), COUNT(*), MIN(mileage), MAX(mileage)
+        FROM expenses GROUP BY car_id, month, category;
+    CREATE TRIGGER expenses_rollups_insert AFTER INSERT ON expenses BEGIN
+        INSERT INTO expense_rollups (car_id, month, category, total, count, min_mileage, max_mileage)
+            VALUES (new.car_id, strftime('%Y-%m', new.day * 86400, 'unixepoch'), COALESCE(new.category, ''),
+                    new.amount, 1, new.mileage, new.mileage)
+            ON CONFLICT (car_id, month, category) DO UPDATE SET
+                total = total + excluded.total,
+                count = count + 1,
+                min_mileage = MIN(min_mileage, excluded.min_mileage),
+                max_mileage = MAX(max_mileage, excluded.max_mileage);
+    END;
+    CREATE TRIGGER expenses_rollups_delete AFTER DELETE ON expenses BEGIN
+        UPDATE expense_rollups SET
+            total = total - old.amount,
+            count = count - 1,
+            min_mileage = CASE WHEN old.mileage > min_mileage THEN min_mileage
+                ELSE (SELECT MIN(mileage) FROM expenses WHERE car_id = old.car_id
+                      AND day >= old.day - CAST(strftime('%d', old.day * 86400, 'unixepoch') AS INTEGER) + 1
+                      AND day < CAST(julianday(old.day * 86400, 'unixepoch', 'start of month', '+1 month') - 2440587.5 AS INTEGER)
+                      AND COALESCE(category, '') = COALESCE(old.category, '')) END,
+            max_mileage = CASE WHEN old.mileage < max_mileage THEN max_mileage
+                ELSE (SELECT MAX(mileage) FROM expenses WHERE car_id = old.car_id
+                      AND day >= old.day - CAST(strftime('%d', old.day * 86400, 'unixepoch') AS INTEGER) + 1
+                      AND day < CAST(julianday(old.day * 86400, 'unixepoch', 'start of month', '+1 month') - 2440587.5 AS INTEGER)
+                      AND COALESCE(category, '') = COALESCE(old.category, '')) END
+        WHERE car_id = old.car_id AND month = strftime('%Y-%m', old.day * 86400, 'unixepoch')
+            AND category = COALESCE(old.category, '');
+        DELETE FROM expense_rollups WHERE car_id = old.car_id AND month = strftime('%Y-%m', old.day * 86400, 'unixepoch')
+            AND category = COALESCE(old.category, '') AND count <= 0;
+    END;
+    ''',
+]
 
+# Номер миграции, переводящей даты в номера дней (см. expenses_invalid_date)
+DAY_MIGRATION = 5
+
+@profiling.timed
+def migrate(connection):
+    """
+    Приводит схему БД к актуальной версии, применяя недостающие миграции.
+    Каждая миграция выполняется в отдельной транзакции вместе с обновлением user_version
+    """
+    connection.execute("PRAGMA foreign_keys = OFF")
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            connection.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+        except Exception:
+            connection.rollback()
+            raise
+    if version < DAY_MIGRATION <= len(MIGRATIONS):
+        invalid = connection.execute("SELECT COUNT(*) FROM expenses_invalid_date").fetchone()[0]
+        if invalid:
+            print(f"Расходов с некорректной датой не перенесено: {invalid}, они сохранены в таблице expenses_invalid_date")
+    # Внешние ключи включаются только после миграций: пересоздание таблиц
+    # со включенными ключами запускало бы каскадное удаление
+    connection.execute("PRAGMA foreign_keys = ON")
+
+@profiling.timed
+def init_storage(db_file:str=None):
+    """
+    Создаёт папку 'data', если она не существует.
+    Задаёт файл БД для соединений всех потоков и применяет миграции схемы
+    """
+    global _db_file
+    if db_file is None:
+        db_file = DB_FILE
+        if not os.path.exists(DATA_DIR):
+            os.makedirs(DATA_DIR)
+
+    close_connections()
+    cache.clear()
+    _db_file = db_file
+    migrate(get_connection())
+    _notify("reset", None)
+
+# Дата передаётся строкой YYYY-MM-DD и переводится в номер дня на стороне БД;
+# некорректная дата даёт NULL и нарушает ограничение NOT NULL колонки day
+INSERT_EXPENSE_SQL = '''INSERT INTO expenses (car_id, amount, day, category, description, mileage)
+                        VALUES (:car_id, :amount, CAST(julianday(:date) - 2440587.5 AS INTEGER), :category, :description, :mileage)'''
+
+@profiling.timed
 def save_expense(expense:Expense):
     """
     Сохраняет в БД строку расхода
+    Возвращает ID сохранённой строки либо None при ошибке (внутри transaction() ошибка пробрасывается)
     """
     try:
-        cur.execute(
-            '''INSERT INTO expenses (car_id, amount, date, category, description, mileage) 
-                    VALUES (:car_id, :amount, :date, :category, :description, :mileage)''',
-            expense.to_dict())
-
-        conn.commit()
+        with transaction() as conn:
+            row = conn.execute(f"{INSERT_EXPENSE_SQL} RETURNING id, amount, mileage, day", expense.to_dict()).fetchone()
+        _changed(expense.car_id, "insert", [row])
+        return row["id"]
     except Exception as e:
+        if in_transaction():
+            raise
         print(f"Ошибка при сохранении данных: {e}")
+        return None
+
+@profiling.timed(returns_count=True)
+def save_expenses(expenses, chunk_size:int=1000):
+    """
+    Сохраняет в БД поток строк расходов (словари в формате Expense.to_dict) одной транзакцией.
+    Строки читаются из итератора и вставляются пачками по chunk_size через executemany,
+    поэтому в памяти одновременно находится не больше одной пачки.
+    При ошибке транзакция откатывается целиком и исключение пробрасывается дальше.
+    Возвращает количество сохранённых строк
+    """
+    saved = 0
+    chunk = []
+    car_ids = set()
+    with transaction() as conn:
+        for expense in expenses:
+            chunk.append(expense)
+            if len(chunk) >= chunk_size:
+                conn.executemany(INSERT_EXPENSE_SQL, chunk)
+                car_ids.update(row["car_id"] for row in chunk)
+                saved += len(chunk)
+                chunk.clear()
+        if chunk:
+            conn.executemany(INSERT_EXPENSE_SQL, chunk)
+            car_ids.update(row["car_id"] for row in chunk)
+            saved += len(chunk)
+    for car_id in car_ids:
+        _changed(car_id, "reset")
+    return saved
+
+def _expense_from_row(row):
+    """
+    Собирает объект Expense из строки выборки expenses без повторной валидации
+    """
+    return Expense.from_db(
+        id=row['id'],
+        car_id=row["car_id"],
+        amount=float(row["amount"]),
+        category=row["category"],
+        date=row["date"],
+        description=row["description"],
+        mileage=row["mileage"]
+    )
 
+@profiling.timed
 def load_expenses(car_id:int, raw:bool=False):
     """
     Получает из БД строки расходов по ID А/М
@@ -61,46 +536,207 @@ def load_expenses(car_id:int, raw:bool=False):
     """
     expenses = []
     try:
-        cur.execute("SELECT id, car_id, amount, category, date, description, mileage FROM expenses WHERE car_id = :car_id ORDER BY mileage ASC", {"car_id": car_id})
-        rows = cur.fetchall()
+        rows = get_connection().execute("SELECT id, car_id, amount, category, date, description, mileage FROM expenses WHERE car_id = :car_id ORDER BY mileage ASC, id ASC", {"car_id": car_id}).fetchall()
         if raw:
             return rows
         for row in rows:
-            t = Expense(
-                id=row['id'],
-                car_id=row["car_id"],
-                amount=float(row["amount"]),
-                category=row["category"],
-                date=row["date"],
-                description=row["description"],
-                mileage=row["mileage"]
-            )
-            expenses.append(t)
+            expenses.append(_expense_from_row(row))
 
     except Exception as e:
         print(f"Ошибка при загрузке данных: {e}")
         return []  # возвращаем пустой список при ошибке
     return expenses
 
+@profiling.timed
+def load_expense_batch(car_id:int, date_from=None, date_to=None):
+    """
+    Получает из БД расходы А/М в колоночном виде, без объекта Expense на каждую строку.
+    Необязательные границы периода date_from, date_to (включительно) - строки YYYY-MM-DD или datetime.date.
+    Даты возвращаются номерами дней от 1970-01-01, порядок - по возрастанию пробега
+    Возвращает объект ExpenseBatch
+    """
+    where, params = _expense_filters(car_id, date_from, date_to)
+    try:
+        rows = get_connection().execute(
+            f"SELECT id, amount, mileage, day, category FROM expenses WHERE {where} ORDER BY mileage ASC, id ASC",
+            params).fetchall()
+    except Exception as e:
+        print(f"Ошибка при загрузке данных: {e}")
+        return ExpenseBatch(car_id)
+    if not rows:
+        return ExpenseBatch(car_id)
+    ids, amounts, mileages, days, categories = zip(*rows)
+    return ExpenseBatch(car_id, ids, amounts, mileages, days, categories)
+
+def iter_expenses(car_ids:list=None, chunk_size:int=5000):
+    """
+    Потоково читает из БД расходы выбранных А/М (или всего автопарка при car_ids = None).
+    Генератор: возвращает пачки не больше chunk_size сырых строк, поэтому в памяти
+    не держится больше одной пачки независимо от объёма выборки
+    """
+    columns = "SELECT id, car_id, amount, category, date, description, mileage FROM expenses"
+    conn = get_connection()
+    if car_ids is None:
+        queries = [(f"{columns} ORDER BY car_id, mileage, id", ())]
+    else:
+        queries = [(f"{columns} WHERE car_id = ? ORDER BY mileage, id", (car_id,)) for car_id in car_ids]
+    for query, params in queries:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+@profiling.timed
+def load_expenses_page(car_id:int, before:tuple=None, after:tuple=None, limit:int=100, category:str=None):
+    """
+    Получает из БД страницу расходов А/М по ключу (mileage, id) без сканирования всей истории:
+    after - следующие limit строк после ключа, before - предыдущие limit строк перед ключом,
+    без ключей - последние limit строк. При переданной category - только расходы этой категории.
+    Строки всегда возвращаются по возрастанию пробега
+    Возвращает список объектов Expense
+    """
+    where, params = _expense_filters(car_id, category=category)
+    columns = f"SELECT id, car_id, amount, category, date, description, mileage FROM expenses WHERE {where}"
+    try:
+        conn = get_connection()
+        if after is not None:
+            rows = conn.execute(f"{columns} AND (mileage, id) > (?, ?) ORDER BY mileage ASC, id ASC LIMIT ?",
+                                (*params, *after, limit)).fetchall()
+        else:
+            if before is not None:
+                rows = conn.execute(f"{columns} AND (mileage, id) < (?, ?) ORDER BY mileage DESC, id DESC LIMIT ?",
+                                    (*params, *before, limit)).fetchall()
+            else:
+                rows = conn.execute(f"{columns} ORDER BY mileage DESC, id DESC LIMIT ?", (*params, limit)).fetchall()
+            rows.reverse()
+        return [_expense_from_row(row) for row in rows]
+    except Exception as e:
+        print(f"Ошибка при загрузке данных: {e}")
+        return []
+
+@profiling.timed
+def load_expenses_between(car_id:int, date_from=None, date_to=None, raw:bool=False):
+    """
+    Получает из БД расходы А/М за период по индексу (car_id, day), без просмотра всей истории.
+    Границы date_from, date_to включительно - строки YYYY-MM-DD или datetime.date, None - без границы.
+    Строки возвращаются по возрастанию даты
+    Возвращает список объектов Expense, при передаче raw = true - сырые строки
+    """
+    where, params = _expense_filters(car_id, date_from, date_to)
+    try:
+        rows = get_connection().execute(
+            f"SELECT id, car_id, amount, category, date, description, mileage FROM expenses WHERE {where} ORDER BY day ASC, id ASC",
+            params).fetchall()
+    except Exception as e:
+        print(f"Ошибка при загрузке данных: {e}")
+        return []
+    if raw:
+        return rows
+    return [_expense_from_row(row) for row in rows]
+
+@profiling.timed
+def load_period_totals(car_id:int, date_from=None, date_to=None):
+    """
+    Считает в БД итоги расходов А/М за период (границы включительно): сумму, количество трат,
+    минимальный и максимальный пробег
+    Возвращает строку sqlite3.Row (total_amount, expense_count, min_mileage, max_mileage)
+    либо None при ошибке
+    """
+    rollup = _rollup_filters(car_id, date_from, date_to)
+    if rollup is not None:
+        where, params = rollup
+        sql = '''SELECT COALESCE(SUM(total), 0) AS total_amount, COALESCE(SUM(count), 0) AS expense_count,
+                        MIN(min_mileage) AS min_mileage, MAX(max_mileage) AS max_mileage
+                 FROM expense_rollups WHERE {where}'''
+    else:
+        where, params = _expense_filters(car_id, date_from, date_to)
+        sql = '''SELECT COALESCE(SUM(amount), 0) AS total_amount, COUNT(*) AS expense_count,
+                        MIN(mileage) AS min_mileage, MAX(mileage) AS max_mileage
+                 FROM expenses WHERE {where}'''
+    try:
+        return get_connection().execute(sql.format(where=where), params).fetchone()
+    except Exception as e:
+        print(f"Ошибка при получении данных: {e}")
+        return None
+
+# Русские слова поиска не короче этой длины теряют два последних символа (типичное окончание),
+# чтобы "колодки" находило "колодок", а "тормоз" - "тормозных"
+SEARCH_STEM_LENGTH = 5
+CYRILLIC_WORD = re.compile(r"[а-яё]+", re.IGNORECASE)
+
+def _fts_query(text:str):
+    """
+    Переводит строку поиска пользователя в запрос FTS5; все слова должны встретиться.
+    Русские слова ищутся по префиксу без окончания, остальные слова - по префиксу целиком,
+    числа и слова с цифрами (номера деталей) - точно, как введены.
+    Слова берутся в кавычки, поэтому операторы FTS5 в строке не выполняются
+    Возвращает строку запроса либо None, если слов нет
+    """
+    terms = []
+    for word in re.findall(r"\w+", text):
+        if any(char.isdigit() for char in word):
+            terms.append(f'"{word}"')
+        elif CYRILLIC_WORD.fullmatch(word) and len(word) >= SEARCH_STEM_LENGTH:
+            terms.append(f'"{word[:-2]}"*')
+        else:
+            terms.append(f'"{word}"*')
+    return " ".join(terms) or None
+
+@profiling.timed
+def search_expenses(text:str, car_id:int=None, date_from=None, date_to=None, category:str=None,
+                    limit:int=100, offset:int=0):
+    """
+    Ищет расходы по словам в описании и категории через полнотекстовый индекс expenses_fts.
+    Поиск можно ограничить А/М, периодом (границы включительно) и категорией.
+    Результаты упорядочены по релевантности (bm25), страница - limit строк начиная с offset
+    Возвращает список объектов Expense
+    """
+    match = _fts_query(text)
+    if match is None:
+        return []
+    where, params = _expense_filters(car_id, date_from, date_to, category=category)
+    try:
+        rows = get_connection().execute(
+            f'''WITH matches AS (SELECT rowid, rank FROM expenses_fts WHERE expenses_fts MATCH ?)
+                SELECT id, car_id, amount, category, date, description, mileage
+                FROM matches JOIN expenses ON id = matches.rowid
+                WHERE {where}
+                ORDER BY matches.rank, id LIMIT ? OFFSET ?''', (match, *params, limit, offset)).fetchall()
+    except Exception as e:
+        print(f"Ошибка при поиске данных: {e}")
+        return []
+    return [_expense_from_row(row) for row in rows]
+
+@profiling.timed
 def save_car(car):
     """
     Сохраняет в БД строку с данными А/М
+    Возвращает ID сохранённой строки либо None при ошибке (внутри transaction() ошибка пробрасывается)
     """
     try:
-        cur.execute("INSERT INTO cars (model, year, mileage, price) VALUES (:model, :year, :mileage, :price)", car.to_dict())
-        conn.commit()
+        with transaction() as conn:
+            car_id = conn.execute("INSERT INTO cars (model, year, mileage, price) VALUES (:model, :year, :mileage, :price)", car.to_dict()).lastrowid
+        _changed(car_id)
+        return car_id
     except Exception as e:
+        if in_transaction():
+            raise
         print(f"Ошибка при сохранении данных: {e}")
+        return None
 
+@profiling.timed
 def load_cars():
     """
     Получает из БД строки расходов по ID А/М
-    Возвращает список объектов Car
+    Возвращает список объектов Car с заполненными агрегатами расходов
     """
     cars = []
     try:
-        cur.execute("SELECT id, model, year, mileage, price FROM cars ORDER BY id")
-        rows = cur.fetchall()
+        rows = get_connection().execute('''SELECT c.id, c.model, c.year, c.mileage, c.price,
+                                                s.total_amount, s.max_mileage, s.expense_count, s.first_date, s.last_date
+                                         FROM cars c LEFT JOIN car_stats s ON s.car_id = c.id ORDER BY c.id''').fetchall()
         for row in rows:
             car = Car(
                 id=row['id'],
@@ -109,30 +745,386 @@ def load_cars():
                 mileage=row["mileage"],
                 price=row["price"]
             )
+            car.stats = _car_stats_from_row(row)
             cars.append(car)
     except Exception as e:
         print(f"Ошибка при получении данных: 123{e}")
 
     return cars
 
+@profiling.timed
+def load_car(car_id:int):
+    """
+    Получает из БД один А/М по ID вместе с агрегатами расходов
+    Возвращает объект Car либо None, если А/М не найден
+    """
+    try:
+        row = get_connection().execute('''SELECT c.id, c.model, c.year, c.mileage, c.price,
+                                                s.total_amount, s.max_mileage, s.expense_count, s.first_date, s.last_date
+                                         FROM cars c LEFT JOIN car_stats s ON s.car_id = c.id WHERE c.id = ?''', (car_id,)).fetchone()
+    except Exception as e:
+        print(f"Ошибка при получении данных: {e}")
+        return None
+    if row is None:
+        return None
+    car = Car(id=row['id'], model=row["model"], year=row["year"], mileage=row["mileage"], price=row["price"])
+    car.stats = _car_stats_from_row(row)
+    return car
+
+def _expense_filters(car_id:int, date_from=None, date_to=None, mileage_from:float=None, mileage_to:float=None,
+                     category:str=None):
+    """
+    Формирует условие WHERE для расходов А/М (car_id = None - всех А/М) с необязательными
+    границами дат и пробега (включительно) и категорией.
+    Границы дат переводятся в номера дней, поэтому условие по периоду идёт по индексу (car_id, day)
+    Возвращает пару (условие, параметры)
+    """
+    conditions = []
+    params = []
+    if car_id is not None:
+        conditions.append("car_id = ?")
+        params.append(car_id)
+    if date_from is not None:
+        date_from = to_day(date_from)
+    if date_to is not None:
+        date_to = to_day(date_to)
+    for condition, value in (("day >= ?", date_from), ("day <= ?", date_to),
+                             ("mileage >= ?", mileage_from), ("mileage <= ?", mileage_to),
+                             ("category = ?", category)):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    return " AND ".join(conditions) or "1", params
+
+def _rollup_filters(car_id:int, date_from=None, date_to=None, mileage_from:float=None, mileage_to:float=None):
+    """
+    Формирует условие WHERE по месячным итогам expense_rollups, если фильтры выражаются через месяцы:
+    без границ пробега, период начинается с первого и заканчивается последним днём месяца
+    Возвращает пару (условие, параметры) либо None, если нужен запрос по строкам расходов
+    """
+    if mileage_from is not None or mileage_to is not None:
+        return None
+    conditions = []
+    params = []
+    if car_id is not None:
+        conditions.append("car_id = ?")
+        params.append(car_id)
+    if date_from is not None:
+        date_from = from_day(to_day(date_from))
+        if not date_from.endswith("-01"):
+            return None
+        conditions.append("month >= ?")
+        params.append(date_from[:7])
+    if date_to is not None:
+        day = to_day(date_to)
+        if not from_day(day + 1).endswith("-01"):
+            return None
+        conditions.append("month <= ?")
+        params.append(from_day(day)[:7])
+    return " AND ".join(conditions) or "1", params
+
+def _grouped_query(rollup_sql:str, expenses_sql:str, car_id:int, date_from, date_to, mileage_from, mileage_to):
+    """
+    Выполняет группирующий запрос по месячным итогам, если фильтры это позволяют, иначе - по строкам расходов.
+    Запросы содержат {where} для условия фильтров
+    Возвращает список строк sqlite3.Row
+    """
+    rollup = _rollup_filters(car_id, date_from, date_to, mileage_from, mileage_to)
+    if rollup is not None:
+        sql, (where, params) = rollup_sql, rollup
+    else:
+        sql, (where, params) = expenses_sql, _expense_filters(car_id, date_from, date_to, mileage_from, mileage_to)
+    try:
+        return get_connection().execute(sql.format(where=where), params).fetchall()
+    except Exception as e:
+        print(f"Ошибка при получении данных: {e}")
+        return []
+
+@profiling.timed
+def sum_expenses_by_category(car_id:int, date_from:str=None, date_to:str=None, mileage_from:float=None, mileage_to:float=None):
+    """
+    Считает в БД суммы расходов А/М по категориям с необязательными фильтрами по датам и пробегу
+    Возвращает список строк (category, total) по убыванию суммы
+    """
+    return _grouped_query(
+        "SELECT NULLIF(category, '') AS category, SUM(total) AS total FROM expense_rollups WHERE {where} GROUP BY 1 ORDER BY total DESC",
+        "SELECT category, SUM(amount) AS total FROM expenses WHERE {where} GROUP BY category ORDER BY total DESC",
+        car_id, date_from, date_to, mileage_from, mileage_to)
+
+@profiling.timed
+def sum_expenses_by_year(car_id:int, date_from:str=None, date_to:str=None, mileage_from:float=None, mileage_to:float=None):
+    """
+    Считает в БД суммы расходов А/М по годам с необязательными фильтрами по датам и пробегу
+    Возвращает список строк (year, total) по возрастанию года
+    """
+    return _grouped_query(
+        "SELECT CAST(substr(month, 1, 4) AS INTEGER) AS year, SUM(total) AS total FROM expense_rollups WHERE {where} GROUP BY year ORDER BY year",
+        "SELECT CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER) AS year, SUM(amount) AS total FROM expenses WHERE {where} GROUP BY year ORDER BY year",
+        car_id, date_from, date_to, mileage_from, mileage_to)
+
+@profiling.timed
+def sum_expenses_by_month(car_id:int, date_from:str=None, date_to:str=None, mileage_from:float=None, mileage_to:float=None):
+    """
+    Считает в БД суммы расходов А/М по месяцам с необязательными фильтрами по датам и пробегу
+    Возвращает список строк (month, total) по возрастанию месяца; month - строка YYYY-MM
+    """
+    return _grouped_query(
+        "SELECT month, SUM(total) AS total FROM expense_rollups WHERE {where} GROUP BY month ORDER BY month",
+        "SELECT strftime('%Y-%m', day * 86400, 'unixepoch') AS month, SUM(amount) AS total FROM expenses WHERE {where} GROUP BY month ORDER BY month",
+        car_id, date_from, date_to, mileage_from, mileage_to)
+
+@profiling.timed(returns_count=True)
+def rebuild_rollups(car_id:int=None):
+    """
+    Пересчитывает месячные итоги expense_rollups А/М (car_id = None - всех А/М) по строкам расходов,
+    например после правки БД в обход приложения. Выполняется одной транзакцией
+    Возвращает количество строк итогов
+    """
+    where, params = _expense_filters(car_id)
+    with transaction() as conn:
+        conn.execute(f"DELETE FROM expense_rollups WHERE {where}", params)
+        rebuilt = conn.execute(f'''
+            INSERT INTO expense_rollups (car_id, month, category, total, count, min_mileage, max_mileage)
+                SELECT car_id, strftime('%Y-%m', day * 86400, 'unixepoch') AS month, COALESCE(category, '') AS category,
+                       SUM(amount), COUNT(*), MIN(mileage), MAX(mileage)
+                FROM expenses WHERE {where} GROUP BY car_id, month, category''', params).rowcount
+    if car_id is None:
+        _after_commit(cache.clear)
+    else:
+        _changed(car_id)
+    return rebuilt
+
+@profiling.timed
+def load_fleet_summary():
+    """
+    Получает из БД сводку по всем А/М одним запросом по агрегатам car_stats:
+    сумма затрат, пробег, количество трат, стоимость километра и затраты в год.
+    Затраты в год считаются за период от первой до последней траты, но не меньше года
+    Возвращает список строк sqlite3.Row
+    """
+    try:
+        return get_connection().execute('''
+            SELECT c.id AS car_id, c.model, c.year, c.mileage, c.price,
+                   COALESCE(s.total_amount, 0) AS total_amount,
+                   COALESCE(s.max_mileage, c.mileage) AS max_mileage,
+                   COALESCE(s.expense_count, 0) AS expense_count,
+                   s.first_date, s.last_date,
+                   CASE WHEN s.max_mileage > c.mileage THEN s.total_amount / (s.max_mileage - c.mileage) END AS cost_per_km,
+                   s.total_amount / MAX((julianday(s.last_date) - julianday(s.first_date) + 1) / 365.25, 1.0) AS cost_per_year
+            FROM cars c LEFT JOIN car_stats s ON s.car_id = c.id
+            ORDER BY c.id''').fetchall()
+    except Exception as e:
+        print(f"Ошибка при получении данных: {e}")
+        return []
+
+@profiling.timed
+def load_fleet_category_totals():
+    """
+    Получает из БД суммы затрат по категориям для всех А/М одним сгруппированным запросом по месячным итогам
+    Возвращает список строк sqlite3.Row (car_id, category, total)
+    """
+    try:
+        return get_connection().execute(
+            "SELECT car_id, NULLIF(category, '') AS category, SUM(total) AS total FROM expense_rollups GROUP BY car_id, 2").fetchall()
+    except Exception as e:
+        print(f"Ошибка при получении данных: {e}")
+        return []
+
+def _car_stats_from_row(row):
+    """
+    Собирает объект CarStats из строки выборки; для А/М без расходов возвращает пустые агрегаты
+    """
+    if row["expense_count"] is None:
+        return CarStats()
+    return CarStats(
+        total_amount=row["total_amount"],
+        max_mileage=row["max_mileage"],
+        expense_count=row["expense_count"],
+        first_date=row["first_date"],
+        last_date=row["last_date"]
+    )
+
+@profiling.timed
+def load_car_stats(car_id:int):
+    """
+    Получает из БД агрегаты расходов по ID А/М без чтения самих расходов
+    Возвращает объект CarStats
+    """
+    try:
+        row = get_connection().execute("SELECT total_amount, max_mileage, expense_count, first_date, last_date FROM car_stats WHERE car_id = ?", (car_id,)).fetchone()
+        if row is not None:
+            return _car_stats_from_row(row)
+    except Exception as e:
+        print(f"Ошибка при получении данных: {e}")
+    return CarStats()
+
+@profiling.timed
 def delete_car(car_id:int):
     """
     Удаляет из БД строку данных об А/М по переданному car_id
-    Так же удаляет связанные строки расходов (по ключу car_id)
+    Связанные строки расходов удаляются каскадно (внешний ключ car_id)
+    Внутри transaction() ошибка пробрасывается, иначе выводится в консоль
     """
     try:
-        cur.execute("DELETE FROM cars WHERE id = ?", (car_id,))
-        cur.execute("DELETE FROM expenses WHERE car_id = ?", (car_id,))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute("DELETE FROM cars WHERE id = ?", (car_id,))
+        _changed(car_id, "reset")
     except Exception as e:
+        if in_transaction():
+            raise
         print(f"Ошибка при удалении данных: {e}")
 
+@profiling.timed
 def delete_expense(expense_id:int):
     """
     Удаляет из БД строку данных о расходе по переданному id
+    Внутри transaction() ошибка пробрасывается, иначе выводится в консоль
     """
     try:
-        cur.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
-        conn.commit()
+        with transaction() as conn:
+            deleted = conn.execute("DELETE FROM expenses WHERE id = ? RETURNING id, car_id, amount, mileage, day", (expense_id,)).fetchone()
+        if deleted is not None:
+            _changed(deleted["car_id"], "delete", [deleted])
     except Exception as e:
-        print(f"Ошибка при удалении данных: {e}")
\ No newline at end of file
+        if in_transaction():
+            raise
+        print(f"Ошибка при удалении данных: {e}")
+
+def _notify_deleted(rows):
+    """
+    Отмечает удаление строк расходов в кеше и у подписчиков; массовое удаление - как "reset"
+    """
+    car_ids = {row["car_id"] for row in rows}
+    for car_id in car_ids:
+        _changed(car_id, "reset")
+
+@profiling.timed
+def delete_expenses(expense_ids, chunk_size:int=500, car_id:int=None):
+    """
+    Удаляет из БД расходы по списку id одной транзакцией, пачками по chunk_size id в условии IN (...).
+    С car_id удаляются только расходы этого А/М, id расходов других А/М пропускаются.
+    При ошибке транзакция откатывается целиком и исключение пробрасывается дальше
+    Возвращает список удалённых строк (id, car_id)
+    """
+    expense_ids = list(expense_ids)
+    car_condition, car_params = ("", []) if car_id is None else (" AND car_id = ?", [car_id])
+    deleted = []
+    with transaction() as conn:
+        for start in range(0, len(expense_ids), chunk_size):
+            chunk = expense_ids[start:start + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+            deleted += conn.execute(f"DELETE FROM expenses WHERE id IN ({placeholders}){car_condition} RETURNING id, car_id",
+                                    chunk + car_params).fetchall()
+    _notify_deleted(deleted)
+    return deleted
+
+@profiling.timed(returns_count=True)
+def delete_filtered_expenses(car_id:int, date_from=None, date_to=None, mileage_from:float=None,
+                             mileage_to:float=None, category:str=None, search:str=None):
+    """
+    Удаляет из БД одной транзакцией все расходы А/М, подходящие под фильтры (см. _expense_filters)
+    и, если задана строка search, найденные по ней полнотекстовым поиском (как в search_expenses).
+    При ошибке транзакция откатывается целиком и исключение пробрасывается дальше
+    Возвращает количество удалённых строк
+    """
+    where, params = _expense_filters(car_id, date_from, date_to, mileage_from, mileage_to, category)
+    if search is not None:
+        match = _fts_query(search)
+        if match is None:
+            return 0
+        where += " AND id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)"
+        params.append(match)
+    with transaction() as conn:
+        deleted = conn.execute(f"DELETE FROM expenses WHERE {where}", params).rowcount
+    if deleted:
+        _changed(car_id, "reset")
+    return deleted
+
+class GroupCommitter:
+    """
+    Режим группировки записей: функции записи (save_expense, delete_expense и т.п.), переданные в submit
+    из любых потоков, выполняются в отдельном потоке, и все записи, поступившие в течение window секунд
+    после первой, фиксируются одной транзакцией. Каждая запись выполняется в своей точке сохранения,
+    поэтому ошибка одной записи не откатывает остальные. Результат записи становится доступен
+    через Future только после фиксации транзакции
+    """
+    def __init__(self, window:float = GROUP_COMMIT_WINDOW, max_jobs:int = GROUP_COMMIT_MAX_JOBS):
+        self.window = window
+        self.max_jobs = max_jobs
+        self.commits = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Ставит вызов функции записи в очередь
+        Возвращает Future с результатом функции
+        """
+        if self._closed:
+            raise RuntimeError("GroupCommitter закрыт")
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def close(self):
+        """
+        Фиксирует записи, уже поставленные в очередь, и останавливает поток записи
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        running = True
+        while running:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_jobs:
+                try:
+                    job = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if job is None:
+                    running = False
+                    break
+                batch.append(job)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        results = []
+        try:
+            with transaction():
+                for future, fn, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction():
+                            results.append((future, fn(*args, **kwargs), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            # Не удалось начать или зафиксировать транзакцию: ни одна запись группы не сохранена.
+            # Ошибку получают все задачи группы, включая ещё не начатые (кроме отменённых)
+            for future, _, _, _ in batch:
+                if future.done() or not (future.running() or future.set_running_or_notify_cancel()):
+                    continue
+                future.set_exception(e)
+            return
+        self.commits += 1
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
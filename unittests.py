@@ -1,5 +1,25 @@
+import asyncio
+import importlib.util
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
-from models import Expense, Car
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
+from datetime import date
+from models import Expense, Car, CarStats
+import storage
+import cache
+import cost_index
+import profiling
+import benchmarks
+from exporter import export_expenses
+from importer import import_expenses_csv
+from worker import BackgroundExecutor
+from server import ApiServer
 
 class TestCar(unittest.TestCase):
     def setUp(self):
@@ -49,6 +69,13 @@ class TestCar(unittest.TestCase):
         exp = self.car.calculate_expense()
         self.assertEqual(exp, 1.0)
 
+    def test_validate_date(self):
+        """
+        Тестирует отклонение даты не в формате YYYY-MM-DD, которую не примет БД
+        """
+        with self.assertRaises(ValueError):
+            Expense(id=0, car_id=0, amount=1, category='Другое', date='2025-1-5', description='', mileage=1)
+
     def test_validate_year(self):
         """
         Тестирует работу статического метода валидации года выпуска А/М
@@ -63,5 +90,703 @@ class TestCar(unittest.TestCase):
             )
 
 
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        storage.init_storage(os.path.join(self.tmp_dir.name, "app.db"))
+        storage.save_car(Car(id=0, model='Kia Rio', year='2016', mileage=35000, price=1200000))
+        self.car_id = storage.load_cars()[0].id
+
+    def tearDown(self):
+        storage.close_connections()
+        self.tmp_dir.cleanup()
+
+    def add_expense(self, amount, mileage, date='2025-12-01', category='Другое'):
+        return storage.save_expense(Expense(
+            id=0,
+            car_id=self.car_id,
+            amount=amount,
+            category=category,
+            date=date,
+            description='тест',
+            mileage=mileage
+        ))
+
+    def test_migrations(self):
+        """
+        Тестирует обновление схемы БД старой версии с сохранением данных
+        """
+        connection = sqlite3.connect(":memory:")
+        connection.executescript(storage.MIGRATIONS[0])
+        connection.execute("INSERT INTO cars (model, year, mileage, price) VALUES ('Kia Rio', 2016, 35000, 1200000)")
+        connection.execute("INSERT INTO expenses (car_id, amount, date, category, description, mileage) VALUES (1, 1000, '2025-12-01', 'Другое', '', 36000)")
+        connection.execute("INSERT INTO expenses (car_id, amount, date, category, description, mileage) VALUES (2, 1000, '2025-12-01', 'Другое', '', 36000)")
+        connection.execute("INSERT INTO expenses (car_id, amount, date, category, description, mileage) VALUES (1, 500, '2025-1-5', 'Другое', '', 37000)")
+        connection.execute("INSERT INTO expenses (car_id, amount, date, category, description, mileage) VALUES (1, 700, 'вчера', 'Другое', '', 38000)")
+        connection.commit()
+
+        storage.migrate(connection)
+        self.assertEqual(connection.execute("PRAGMA user_version").fetchone()[0], len(storage.MIGRATIONS))
+        self.assertEqual(connection.execute("SELECT date FROM expenses ORDER BY id").fetchall(), [('2025-12-01',), ('2025-01-05',)])
+        self.assertEqual(connection.execute("SELECT amount FROM expenses_invalid_date").fetchall(), [(700,)])
+        self.assertEqual(connection.execute("SELECT total_amount, expense_count, first_date FROM car_stats").fetchall(), [(1500, 2, '2025-01-05')])
+        connection.execute("DELETE FROM expenses WHERE amount = 500")
+        plan = connection.execute("EXPLAIN QUERY PLAN SELECT * FROM expenses WHERE car_id = 1 ORDER BY mileage").fetchall()
+        self.assertIn("idx_expenses_car_mileage", plan[0][-1])
+        self.assertEqual(connection.execute("SELECT day, date FROM expenses").fetchall(), [(20423, '2025-12-01')])
+
+    def test_delete_car_cascade(self):
+        """
+        Тестирует каскадное удаление расходов вместе с А/М
+        """
+        self.add_expense(1000, 36000)
+        storage.delete_car(self.car_id)
+        self.assertEqual(storage.load_expenses(self.car_id), [])
+        self.assertEqual(storage.get_connection().execute("SELECT COUNT(*) FROM expenses").fetchone()[0], 0)
+
+    def test_car_stats(self):
+        """
+        Тестирует поддержку агрегатов расходов при добавлении и удалении
+        """
+        self.add_expense(1000, 36000, date='2025-01-10')
+        self.add_expense(500, 37000, date='2025-03-01')
+        stats = storage.load_car_stats(self.car_id)
+        self.assertEqual((stats.total_amount, stats.max_mileage, stats.expense_count), (1500, 37000, 2))
+        self.assertEqual((stats.first_date, stats.last_date), ('2025-01-10', '2025-03-01'))
+
+        car = storage.load_cars()[0]
+        self.assertEqual(car.calculate_expense(), 0.75)
+
+        last = storage.load_expenses(self.car_id)[-1]
+        storage.delete_expense(last.id)
+        stats = storage.load_car_stats(self.car_id)
+        self.assertEqual((stats.total_amount, stats.max_mileage, stats.last_date), (1000, 36000, '2025-01-10'))
+
+        storage.delete_expense(storage.load_expenses(self.car_id)[0].id)
+        self.assertEqual(storage.load_car_stats(self.car_id).expense_count, 0)
+
+    def test_import_csv(self):
+        """
+        Тестирует импорт расходов из CSV с отклонением некорректных строк
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "expenses.csv")
+            with open(path, "w", encoding="utf-8") as csv_file:
+                csv_file.write("date,amount,category,mileage,description\n")
+                csv_file.write("2025-01-10,1000,Топливо,36000,АЗС\n")
+                csv_file.write("2025-02-30,1000,Топливо,36500,\n")
+                csv_file.write("2025-03-01,500,Мойки,37000,\n")
+                csv_file.write("2025-03-02,500,Мойки,1000,\n")
+            report = import_expenses_csv(path, car_id=self.car_id, chunk_size=1)
+
+        self.assertEqual(report.imported, 2)
+        self.assertEqual([line for line, error in report.rejected], [3, 5])
+        self.assertEqual(storage.load_car_stats(self.car_id).total_amount, 1500)
+
+    def test_expenses_page(self):
+        """
+        Тестирует постраничную загрузку расходов по ключу (пробег, id)
+        """
+        for mileage in (36000, 37000, 37000, 38000, 39000):
+            self.add_expense(100, mileage)
+        expenses = storage.load_expenses(self.car_id)
+
+        last_page = storage.load_expenses_page(self.car_id, limit=2)
+        self.assertEqual([t.id for t in last_page], [t.id for t in expenses[-2:]])
+        previous_page = storage.load_expenses_page(self.car_id, before=(last_page[0].mileage, last_page[0].id), limit=2)
+        self.assertEqual([t.id for t in previous_page], [t.id for t in expenses[1:3]])
+        next_page = storage.load_expenses_page(self.car_id, after=(expenses[0].mileage, expenses[0].id), limit=2)
+        self.assertEqual([t.id for t in next_page], [t.id for t in expenses[1:3]])
+
+    def test_save_expense_id(self):
+        """
+        Тестирует возврат ID сохранённого расхода и учёт расхода в агрегатах без обращения к БД
+        """
+        car = storage.load_cars()[0]
+        expense_id = self.add_expense(1000, 36000)
+        expense = storage.load_expenses(self.car_id)[0]
+        self.assertEqual(expense_id, expense.id)
+
+        car.stats.add(expense)
+        stored = storage.load_car_stats(self.car_id)
+        for name in CarStats.__slots__:
+            self.assertEqual(getattr(car.stats, name), getattr(stored, name))
+
+    def test_fleet_summary(self):
+        """
+        Тестирует сводку по автопарку без загрузки отдельных расходов
+        """
+        storage.save_car(Car(id=0, model='Hyundai Solaris', year='2017', mileage=45000, price=1100000))
+        self.add_expense(1000, 36000, date='2024-01-01', category='Топливо')
+        self.add_expense(3000, 37000, date='2025-12-31', category='ТО')
+
+        rows = {row['car_id']: row for row in storage.load_fleet_summary()}
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[self.car_id]['cost_per_km'], 2.0)
+        self.assertAlmostEqual(rows[self.car_id]['cost_per_year'], 4000 / (731 / 365.25))
+        self.assertIsNone(list(rows.values())[1]['cost_per_km'])
+
+        totals = {(row['car_id'], row['category']): row['total'] for row in storage.load_fleet_category_totals()}
+        self.assertEqual(totals, {(self.car_id, 'Топливо'): 1000, (self.car_id, 'ТО'): 3000})
+
+    @unittest.skipUnless(importlib.util.find_spec("pandas") and importlib.util.find_spec("matplotlib"),
+                         "нужны pandas и matplotlib")
+    def test_render_car_charts(self):
+        """
+        Тестирует сохранение графиков А/М в PNG без интерфейса
+        """
+        import analytics
+        self.add_expense(1000, 36000, date='2024-01-01', category='Топливо')
+        paths = analytics.render_car_charts(self.car_id, self.tmp_dir.name)
+        self.assertEqual([os.path.basename(path) for path in paths],
+                         [f"car_{self.car_id}_{chart}.png" for chart in ("categories", "years", "monthly", "cost_per_km")])
+        with open(paths[0], "rb") as png:
+            self.assertEqual(png.read(8), b"\x89PNG\r\n\x1a\n")
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "нужен numpy")
+    def test_downsample(self):
+        """
+        Тестирует прореживание длинного ряда для графика с сохранением пиков и крайних точек
+        """
+        import analytics
+        x = list(range(100000))
+        y = [0.0] * 100000
+        y[54321] = 5.0
+        y[77777] = -3.0
+        xs, ys = analytics.downsample(x, y, max_points=200)
+        self.assertLessEqual(len(xs), 202)
+        self.assertEqual((xs[0], xs[-1]), (0, 99999))
+        self.assertEqual((ys.max(), ys.min()), (5.0, -3.0))
+        self.assertIn(54321, xs)
+
+    def test_export_csv(self):
+        """
+        Тестирует потоковую выгрузку в CSV и обратный импорт выгруженного файла
+        """
+        for mileage in (36000, 37000, 38000):
+            self.add_expense(100, mileage)
+        path = os.path.join(self.tmp_dir.name, "expenses.csv")
+        self.assertEqual(export_expenses(path, [self.car_id], chunk_size=2), 3)
+        self.assertEqual(os.listdir(self.tmp_dir.name).count("expenses.csv.part"), 0)
+
+        report = import_expenses_csv(path)
+        self.assertEqual((report.imported, report.rejected), (3, []))
+        self.assertEqual(storage.load_car_stats(self.car_id).expense_count, 6)
+
+        with self.assertRaises(ValueError):
+            export_expenses(os.path.join(self.tmp_dir.name, "expenses.txt"))
+
+    def test_sum_expenses(self):
+        """
+        Тестирует группировку расходов по категориям и годам в БД с фильтрами
+        """
+        self.add_expense(1000, 36000, date='2024-05-01', category='Топливо')
+        self.add_expense(3000, 37000, date='2025-01-01', category='ТО')
+        self.add_expense(500, 38000, date='2025-02-01', category='Топливо')
+
+        by_category = storage.sum_expenses_by_category(self.car_id)
+        self.assertEqual([tuple(row) for row in by_category], [('ТО', 3000), ('Топливо', 1500)])
+        by_year = storage.sum_expenses_by_year(self.car_id, mileage_from=36500)
+        self.assertEqual([tuple(row) for row in by_year], [(2025, 3500)])
+        by_year = storage.sum_expenses_by_year(self.car_id, date_to='2024-12-31')
+        self.assertEqual([tuple(row) for row in by_year], [(2024, 1000)])
+
+    def test_rollups(self):
+        """
+        Тестирует поддержку месячных итогов триггерами, их пересчёт и чтение отчётов из итогов
+        """
+        self.add_expense(1000, 36000, date='2025-01-10', category='Топливо')
+        first = self.add_expense(500, 35500, date='2025-01-20', category='Топливо')
+        self.add_expense(700, 37000, date='2025-01-31', category='Топливо')
+        self.add_expense(3000, 38000, date='2025-02-01', category='ТО')
+        storage.delete_expense(first)
+        query = "SELECT month, category, total, count, min_mileage, max_mileage FROM expense_rollups ORDER BY month"
+        rollups = [tuple(row) for row in storage.get_connection().execute(query)]
+        self.assertEqual(rollups, [('2025-01', 'Топливо', 1700, 2, 36000, 37000), ('2025-02', 'ТО', 3000, 1, 38000, 38000)])
+
+        storage.get_connection().execute("DELETE FROM expense_rollups")
+        self.assertEqual(storage.rebuild_rollups(), 2)
+        self.assertEqual([tuple(row) for row in storage.get_connection().execute(query)], rollups)
+
+        by_month = storage.sum_expenses_by_month(self.car_id, date_from='2025-02-01', date_to='2025-02-28')
+        self.assertEqual([tuple(row) for row in by_month], [('2025-02', 3000)])
+        by_month = storage.sum_expenses_by_month(self.car_id, date_from='2025-01-15')
+        self.assertEqual([tuple(row) for row in by_month], [('2025-01', 700), ('2025-02', 3000)])
+        self.assertEqual(tuple(storage.load_period_totals(self.car_id, date_to='2025-01-31')), (1700, 2, 36000, 37000))
+        totals = {row['category']: row['total'] for row in storage.load_fleet_category_totals()}
+        self.assertEqual(totals, {'Топливо': 1700, 'ТО': 3000})
+
+        storage.delete_car(self.car_id)
+        self.assertEqual(storage.get_connection().execute("SELECT COUNT(*) FROM expense_rollups").fetchone()[0], 0)
+
+    def test_expenses_between(self):
+        """
+        Тестирует выборку и итоги расходов за период по номерам дней
+        """
+        self.add_expense(1000, 36000, date='2024-12-31')
+        self.add_expense(500, 37000, date='2025-01-01')
+        self.add_expense(700, 38000, date='2025-02-01')
+        expenses = storage.load_expenses_between(self.car_id, '2025-01-01', date(2025, 2, 1))
+        self.assertEqual([e.date for e in expenses], ['2025-01-01', '2025-02-01'])
+        self.assertEqual(len(storage.load_expenses_between(self.car_id, date_to='2024-12-31')), 1)
+
+        totals = storage.load_period_totals(self.car_id, '2025-01-01')
+        self.assertEqual(tuple(totals), (1200, 2, 37000, 38000))
+        self.assertEqual(len(storage.load_expense_batch(self.car_id, date_from='2025-01-01')), 2)
+
+        plan = storage.get_connection().execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM expenses WHERE car_id = 1 AND day >= 0 ORDER BY day").fetchall()
+        self.assertIn("idx_expenses_car_day", plan[0][-1])
+
+    def test_cost_index(self):
+        """
+        Тестирует окна стоимости километра по индексу накопленных сумм и его обновление при записи
+        """
+        self.add_expense(1000, 36000, date='2024-06-01')
+        self.add_expense(500, 37000, date='2025-01-10')
+        car = storage.load_cars()[0]
+        index = cost_index.get_cost_index(car)
+        self.assertEqual(index.cost_per_km(), car.calculate_expense())
+        self.assertEqual(index.mileage_window(36000, 37000), (500, 1000))
+        self.assertEqual(index.date_window('2025-01-01', '2025-12-31'), (500, 1000))
+        self.assertEqual(index.cost_per_km(date_to='2024-12-31'), 1.0)
+
+        expense_id = self.add_expense(300, 36500, date='2024-09-01')
+        self.assertIs(cost_index.get_cost_index(car), index)
+        self.assertEqual(index.mileage_window(36000, 37000), (800, 1000))
+        self.assertEqual(index.last_km(1500), 1.2)
+        self.assertEqual(index.rolling_cost_per_km(1000), ([36000, 36500, 37000], [1.0, 1.3, 0.8]))
+
+        # Уведомление о строке, уже попавшей в выборку при построении индекса, не учитывает её повторно
+        row = storage.get_connection().execute("SELECT id, amount, mileage, day FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+        cost_index._on_expenses_changed("insert", self.car_id, [row])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.cost_per_km(), 1.8 / 2)
+
+        storage.delete_expense(expense_id)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.date_window('2024-01-01', '2024-12-31'), (1000, 1000))
+
+    def test_delete_expenses(self):
+        """
+        Тестирует удаление списка трат и трат по фильтру одной транзакцией
+        """
+        ids = [self.add_expense(100, 36000 + i, category='Мойки' if i % 2 else 'Топливо') for i in range(10)]
+        deleted = storage.delete_expenses(ids[:4] + [-1], chunk_size=3)
+        self.assertEqual(sorted(row["id"] for row in deleted), ids[:4])
+        self.assertEqual(storage.load_car_stats(self.car_id).expense_count, 6)
+
+        self.assertEqual([e.category for e in storage.load_expenses_page(self.car_id, category='Мойки')], ['Мойки'] * 3)
+        self.assertEqual(storage.delete_filtered_expenses(self.car_id, category='Мойки'), 3)
+        stats = storage.load_car_stats(self.car_id)
+        self.assertEqual((stats.expense_count, stats.max_mileage), (3, 36008))
+
+        storage.save_expense(Expense(id=0, car_id=self.car_id, amount=100, category='Топливо', date='2025-12-01',
+                                     description='Замена тормозных колодок', mileage=36100))
+        self.assertEqual(storage.delete_filtered_expenses(self.car_id, search='колодки'), 1)
+        self.assertEqual(storage.load_car_stats(self.car_id).expense_count, 3)
+
+    def test_search_expenses(self):
+        """
+        Тестирует полнотекстовый поиск по описанию и категории с фильтрами и синхронизацию индекса
+        """
+        def add(description, date='2025-01-01', category='ТО'):
+            return storage.save_expense(Expense(id=0, car_id=self.car_id, amount=100, category=category,
+                                                date=date, description=description, mileage=36000))
+        pads = add('Замена тормозных колодок')
+        add('Замена масла', date='2024-01-01')
+        add('Мойка кузова', category='Мойки')
+
+        found = storage.search_expenses('колодки тормоз', self.car_id)
+        self.assertEqual([e.id for e in found], [pads])
+        self.assertEqual(len(storage.search_expenses('замена')), 2)
+        self.assertEqual(len(storage.search_expenses('замена', self.car_id, date_from='2025-01-01')), 1)
+        self.assertEqual(len(storage.search_expenses('мойки')), 1)
+        self.assertEqual(len(storage.search_expenses('замена', limit=1, offset=1)), 1)
+        self.assertEqual(storage.search_expenses('" OR *'), [])
+        bracket = add('Bracket A1234567')
+        self.assertEqual([e.id for e in storage.search_expenses('bracket A1234567')], [bracket])
+        self.assertEqual(storage.search_expenses('brake'), [])
+        self.assertEqual(storage.search_expenses('A12345'), [])
+
+        storage.delete_expense(pads)
+        self.assertEqual(storage.search_expenses('колодки'), [])
+
+    def test_expense_batch(self):
+        """
+        Тестирует колоночную загрузку расходов и расчёт руб/км по ней
+        """
+        self.add_expense(1000, 36000, date='1970-01-02')
+        self.add_expense(500, 37000, date='2025-03-01')
+        batch = storage.load_expense_batch(self.car_id)
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(list(batch.days), [1, 20148])
+        self.assertEqual(batch.categories, ['Другое', 'Другое'])
+
+        car = Car(id=self.car_id, model='Kia Rio', year='2016', mileage=35000, price=1200000)
+        car.expenses = batch
+        self.assertEqual(car.calculate_expense(), 0.75)
+
+        expense = storage.load_expenses(self.car_id)[0]
+        self.assertFalse(hasattr(expense, '__dict__'))
+        self.assertEqual((expense.amount, expense.date), (1000, '1970-01-02'))
+
+    def test_read_during_write(self):
+        """
+        Тестирует чтение из другого потока, пока открыта транзакция записи (режим WAL)
+        """
+        self.add_expense(1000, 36000)
+        with storage.transaction() as conn:
+            conn.execute("DELETE FROM expenses")
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                stats = executor.submit(storage.load_car_stats, self.car_id).result(timeout=5)
+        self.assertEqual(stats.expense_count, 1)
+        self.assertEqual(storage.load_car_stats(self.car_id).expense_count, 0)
+
+    def test_reinit_same_file(self):
+        """
+        Тестирует переоткрытие соединений других потоков после повторной инициализации того же файла БД
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(storage.load_cars).result(timeout=5)
+            storage.init_storage(storage._db_file)
+            self.assertEqual(len(executor.submit(storage.load_cars).result(timeout=5)), 1)
+
+    def test_transaction(self):
+        """
+        Тестирует единицу работы: откат при ошибке, точки сохранения и отложенные уведомления
+        """
+        self.add_expense(1000, 36000)
+        index = cost_index.get_cost_index(storage.load_cars()[0])
+        with self.assertRaises(sqlite3.IntegrityError):
+            with storage.transaction():
+                self.add_expense(500, 37000)
+                storage.save_expense(Expense(id=0, car_id=-1, amount=1, category='Другое',
+                                             date='2025-12-01', description='', mileage=1))
+        self.assertEqual(storage.load_car_stats(self.car_id).expense_count, 1)
+        self.assertEqual(len(index), 1)
+
+        with storage.transaction():
+            self.add_expense(500, 37000)
+            self.assertEqual(len(index), 1)
+            with self.assertRaises(ValueError):
+                with storage.transaction():
+                    self.add_expense(700, 38000)
+                    raise ValueError
+        self.assertEqual(storage.load_car_stats(self.car_id).max_mileage, 37000)
+        self.assertEqual(index.mileage_window(36000, 38000), (500, 1000))
+        self.assertFalse(storage.in_transaction())
+
+    def test_group_commit(self):
+        """
+        Тестирует группировку записей из нескольких потоков в общие транзакции
+        """
+        with storage.GroupCommitter(window=0.05) as committer:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = list(executor.map(lambda i: committer.submit(self.add_expense, 100, 36000 + i), range(20)))
+            failed_save = committer.submit(storage.save_expense, Expense(id=0, car_id=-1, amount=1, category='Другое',
+                                                                         date='2025-12-01', description='', mileage=1))
+            ids = [future.result(timeout=5) for future in futures]
+        self.assertEqual(len(set(ids)), 20)
+        self.assertIsInstance(failed_save.exception(), sqlite3.IntegrityError)
+        self.assertLess(committer.commits, 20)
+        self.assertEqual(storage.load_car_stats(self.car_id).expense_count, 20)
+
+    def test_group_commit_locked(self):
+        """
+        Тестирует передачу ошибки всем записям группы, если транзакцию не удалось начать
+        """
+        blocker = sqlite3.connect(storage._db_file, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        timeout, storage.BUSY_TIMEOUT = storage.BUSY_TIMEOUT, 0.1
+        try:
+            with storage.GroupCommitter() as committer:
+                future = committer.submit(storage.save_car, Car(id=0, model='Lada Vesta', year='2020', mileage=1000, price=900000))
+                self.assertIsInstance(future.exception(timeout=5), sqlite3.OperationalError)
+        finally:
+            storage.BUSY_TIMEOUT = timeout
+            blocker.execute("ROLLBACK")
+            blocker.close()
+
+    def test_profiling(self):
+        """
+        Тестирует замеры операций хранилища: гистограмму, строки и SQL медленных операций
+        """
+        self.add_expense(1000, 36000)
+        profiling.enable(report_path=None, slow_ms=0)
+        try:
+            storage.init_storage(storage._db_file)
+            storage.load_expenses(self.car_id)
+            report = profiling.report()
+        finally:
+            profiling.disable()
+            profiling.reset()
+        operation = report["operations"]["storage.load_expenses"]
+        self.assertEqual((operation["count"], operation["rows"]), (1, 1))
+        self.assertEqual(sum(operation["histogram_ms"].values()), 1)
+        slow = [entry for entry in report["slow"] if entry["name"] == "storage.load_expenses"]
+        self.assertIn("FROM expenses", slow[0]["queries"][0])
+
+
+class TestCache(unittest.TestCase):
+    def test_invalidation_on_write(self):
+        """
+        Тестирует пересчёт закешированного результата после изменения данных А/М
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage.init_storage(os.path.join(tmp_dir, "app.db"))
+            car_id = storage.save_car(Car(id=0, model='Kia Rio', year='2016', mileage=35000, price=1200000))
+            calls = []
+
+            def compute():
+                calls.append(1)
+                return storage.load_car_stats(car_id).expense_count
+
+            self.assertEqual(cache.cached("count", car_id, compute), 0)
+            self.assertEqual(cache.cached("count", car_id, compute), 0)
+            expense_id = storage.save_expense(Expense(id=0, car_id=car_id, amount=100, category='Другое', date='2025-12-01', mileage=36000))
+            self.assertEqual(cache.cached("count", car_id, compute), 1)
+            storage.delete_expense(expense_id)
+            self.assertEqual(cache.cached("count", car_id, compute), 0)
+            self.assertEqual(len(calls), 3)
+            storage.close_connections()
+
+    def test_invalidation_by_other_process(self):
+        """
+        Тестирует сброс кеша и индексов после записи другим соединением (другим процессом)
+        и сохранение индекса после записи из другого потока этого процесса
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage.init_storage(os.path.join(tmp_dir, "app.db"))
+            car_id = storage.save_car(Car(id=0, model='Kia Rio', year='2016', mileage=35000, price=1200000))
+            compute = lambda: storage.load_car_stats(car_id).expense_count
+            self.assertEqual(cache.cached("count", car_id, compute), 0)
+            index = cost_index.get_cost_index(storage.load_car(car_id))
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(storage.save_expense, Expense(id=0, car_id=car_id, amount=100, category='Другое',
+                                                              date='2025-12-01', mileage=36000)).result(timeout=5)
+            self.assertEqual(cache.cached("count", car_id, compute), 1)
+            self.assertIs(cost_index.get_cost_index(storage.load_car(car_id)), index)
+
+            other = sqlite3.connect(storage._db_file)
+            other.execute("INSERT INTO expenses (car_id, amount, day, category, description, mileage) VALUES (?, 100, 20423, 'Другое', '', 37000)", (car_id,))
+            other.commit()
+            other.close()
+            self.assertEqual(cache.cached("count", car_id, compute), 2)
+            self.assertEqual(len(cost_index.get_cost_index(storage.load_car(car_id))), 2)
+            storage.close_connections()
+
+    def test_eviction(self):
+        """
+        Тестирует вытеснение давно не использованных записей по количеству и объёму
+        """
+        lru = cache.VersionedCache(max_entries=2, max_bytes=10000)
+        lru.get_or_compute("a", 1, lambda: "a")
+        lru.get_or_compute("b", 1, lambda: "b")
+        lru.get_or_compute("a", 1, lambda: "a")
+        lru.get_or_compute("c", 1, lambda: "c")
+        self.assertEqual(list(lru._entries), ["a", "c"])
+
+        lru.get_or_compute("big", 1, lambda: "x" * (10000 - sys.getsizeof("")))
+        self.assertEqual(list(lru._entries), ["big"])
+        self.assertLessEqual(lru.size, 10000)
+        lru.get_or_compute("huge", 1, lambda: "x" * 20000)
+        self.assertNotIn("huge", lru._entries)
+
+
+class TestStartup(unittest.TestCase):
+    # Время от запуска до первой отрисовки окна, секунды
+    STARTUP_TIME_TARGET = 1.0
+    HEAVY_MODULES = ("pandas", "matplotlib", "numpy", "openpyxl", "pyarrow")
+
+    def test_startup(self):
+        """
+        Тестирует, что до первой отрисовки окна не загружаются pandas и matplotlib,
+        и укладывается ли запуск в целевое время (без дисплея проверяется только импорт)
+        """
+        script = (
+            "import os, sys, tempfile, time\n"
+            "start = time.perf_counter()\n"
+            "import main\n"
+            "main.init_storage(os.path.join(tempfile.mkdtemp(), 'app.db'))\n"
+            "try:\n"
+            "    root = main.tk.Tk()\n"
+            "except main.tk.TclError:\n"
+            "    root = None\n"
+            "if root is not None:\n"
+            "    app = main.CarExpensesApp(root)\n"
+            "    root.update()\n"
+            "print(time.perf_counter() - start)\n"
+            f"print(','.join(m for m in {self.HEAVY_MODULES!r} if m in sys.modules))\n"
+        )
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        elapsed, loaded = result.stdout.splitlines()
+        self.assertEqual(loaded, "")
+        self.assertLess(float(elapsed), self.STARTUP_TIME_TARGET)
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_generate_and_run(self):
+        """
+        Тестирует генератор синтетического автопарка и прогон замеров на маленькой БД
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            car_ids = benchmarks.generate_fleet(os.path.join(tmp_dir, "app.db"), cars=2, expenses_per_car=50, seed=1)
+            self.assertEqual([car.stats.expense_count for car in storage.load_cars()], [50, 50])
+            results = benchmarks.run_benchmarks(car_ids, repeat=1, tmp_dir=tmp_dir)
+            storage.close_connections()
+        self.assertIn("median", results["load_expenses"])
+        self.assertEqual(benchmarks.compare(results, {"results": results}, tolerance=0.2), [])
+
+
+class FakeRoot:
+    """
+    Заменяет окно Tk: запоминает отложенные вызовы root.after для ручного запуска
+    """
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+
+    def run_pending(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class TestBackgroundExecutor(unittest.TestCase):
+    def setUp(self):
+        self.root = FakeRoot()
+        self.busy = []
+        self.executor = BackgroundExecutor(self.root, on_busy_changed=self.busy.append)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_result_delivered_by_poll(self):
+        """
+        Тестирует доставку результата фоновой задачи через опрос из потока интерфейса
+        """
+        results = []
+        task = self.executor.submit(sum, [1, 2, 3], on_done=results.append)
+        task.future.result(timeout=5)
+        self.assertEqual(results, [])
+        self.root.run_pending()
+        self.assertEqual(results, [6])
+        self.assertEqual(self.busy, [1, 0])
+        self.assertFalse(self.executor.busy)
+
+    def test_cancel(self):
+        """
+        Тестирует отмену задачи, поддерживающей cancel_event
+        """
+        results = []
+        started = threading.Event()
+
+        def job(cancel_event, finish=None):
+            started.set()
+            if cancel_event.wait(5) and finish is None:
+                raise CancelledError("Отменено")
+            return finish
+
+        task = self.executor.submit(job, on_done=results.append, cancellable=True)
+        task.cancel()
+        wait([task.future], timeout=5)
+        self.root.run_pending()
+        self.assertEqual(results, [])
+        self.assertFalse(self.executor.busy)
+
+        # Задача, завершившаяся после отмены без CancelledError (запись уже зафиксирована), доставляет результат
+        started.clear()
+        task = self.executor.submit(job, finish="сохранено", on_done=results.append, cancellable=True)
+        started.wait(5)
+        task.cancel()
+        wait([task.future], timeout=5)
+        self.root.run_pending()
+        self.assertEqual(results, ["сохранено"])
+
+    def test_cancel_running_write(self):
+        """
+        Тестирует доставку результата начатой задачи без cancel_event после отмены всех задач
+        """
+        results = []
+        started = threading.Event()
+        release = threading.Event()
+        task = self.executor.submit(lambda: started.set() or release.wait(5), on_done=results.append)
+        started.wait(5)
+        self.executor.cancel_all()
+        release.set()
+        wait([task.future], timeout=5)
+        self.root.run_pending()
+        self.assertEqual(results, [True])
+
+
+class TestApiServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        storage.init_storage(os.path.join(self.tmp_dir.name, "app.db"))
+
+    def tearDown(self):
+        storage.close_connections()
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    async def request(port, method, path, data=None):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        body = json.dumps(data).encode("utf-8") if data is not None else b""
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        response = await reader.read()
+        writer.close()
+        head, _, payload = response.partition(b"\r\n\r\n")
+        return int(head.split(b" ")[1]), json.loads(payload)
+
+    def test_api(self):
+        """
+        Тестирует API: добавление А/М, групповую запись параллельных вставок, чтение и агрегаты
+        """
+        async def scenario():
+            server = ApiServer(read_workers=4)
+            port = await server.start(port=0)
+            try:
+                status, car = await self.request(port, "POST", "/cars", {"model": "Kia Rio", "year": 2016, "mileage": 35000, "price": 1200000})
+                self.assertEqual(status, 201)
+                path = f"/cars/{car['id']}/expenses"
+                expenses = [{"amount": 100, "category": "Топливо", "date": "2025-01-01", "mileage": 36000 + i} for i in range(20)]
+                results = await asyncio.gather(*(self.request(port, "POST", path, expense) for expense in expenses))
+                self.assertEqual({status for status, _ in results}, {201})
+                self.assertLess(server.writer.commits, 20)
+
+                status, error = await self.request(port, "POST", path, {"amount": 100, "category": "Топливо", "date": "2025-02-30", "mileage": 37000})
+                self.assertEqual(status, 400)
+                status, page = await self.request(port, "GET", f"{path}?limit=5")
+                self.assertEqual([row["mileage"] for row in page], [36015 + i for i in range(5)])
+                status, page = await self.request(port, "GET", f"{path}?limit=-1")
+                self.assertEqual(len(page), 1)
+                status, cost = await self.request(port, "GET", f"/cars/{car['id']}/cost-per-km?date_from=2025-01-01")
+                self.assertAlmostEqual(cost["cost_per_km"], 2000 / 1019)
+                status, categories = await self.request(port, "GET", f"/cars/{car['id']}/categories")
+                self.assertEqual(categories, [{"category": "Топливо", "total": 2000}])
+                self.assertEqual((await self.request(port, "GET", "/cars/999"))[0], 404)
+
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(b"POST /cars HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+                self.assertTrue((await reader.read()).startswith(b"HTTP/1.1 400"))
+                writer.close()
+
+                status, other = await self.request(port, "POST", "/cars", {"model": "Lada Vesta", "year": 2020, "mileage": 1000, "price": 900000})
+                await self.request(port, "POST", f"/cars/{other['id']}/expenses", {"amount": 100, "category": "Мойки", "date": "2025-01-01", "mileage": 2000})
+                other_id = (await self.request(port, "GET", f"/cars/{other['id']}/expenses"))[1][0]["id"]
+                self.assertEqual(await self.request(port, "DELETE", path, {"ids": [other_id]}), (200, {"deleted": 0}))
+                self.assertEqual((await self.request(port, "DELETE", "/cars/999/expenses?category=x"))[0], 404)
+            finally:
+                await server.close()
+
+        asyncio.run(scenario())
+
+
 if __name__ == '__main__':
     unittest.main(argv=[''])
@@ -1,6 +1,6 @@
 # utils.py
 import re
-from datetime import datetime
+from datetime import date, datetime
 
 def validate_amount(amount_str: str) -> float:
     """
@@ -65,3 +65,22 @@ def validate_category(category_str: str) -> str:
         raise ValueError("Категория не может быть пустой")
 
     return category_str
+
+
+# Номер дня 1970-01-01 в пролептическом григорианском календаре (date.toordinal)
+EPOCH_ORDINAL = 719163
+
+def to_day(value) -> int:
+    """
+    Переводит дату (строку YYYY-MM-DD или datetime.date) в номер дня от 1970-01-01,
+    в котором даты расходов хранятся в БД
+    """
+    if isinstance(value, str):
+        value = date.fromisoformat(validate_date(value))
+    return value.toordinal() - EPOCH_ORDINAL
+
+def from_day(day: int) -> str:
+    """
+    Переводит номер дня от 1970-01-01 в строку YYYY-MM-DD
+    """
+    return date.fromordinal(day + EPOCH_ORDINAL).isoformat()
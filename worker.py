@@ -0,0 +1,121 @@
+# worker.py
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+class Task:
+    """
+    Фоновая задача: обёртка над Future с флагом отмены.
+    Долгие функции могут принимать cancel_event и периодически проверять его
+    """
+    def __init__(self, future, cancel_event, on_done=None, on_error=None, cancellable=False):
+        self.future = future
+        self.cancel_event = cancel_event
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancellable = cancellable
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """
+        Отменяет задачу: ещё не начатая не запустится, начатая задача с cancel_event прервётся
+        исключением CancelledError при следующей проверке. Задача, которая всё же завершилась
+        (например, запись в БД без cancel_event или уже после последней проверки), доставит результат,
+        чтобы интерфейс отразил уже сделанные изменения
+        """
+        if self.cancellable:
+            self.cancel_event.set()
+        self.future.cancel()
+
+class BackgroundExecutor:
+    """
+    Пул фоновых потоков для запросов к БД, расчётов и выгрузок.
+    Колбэки on_done/on_error вызываются в потоке Tk: завершённые задачи складываются
+    в очередь, которую главный поток опрашивает через root.after
+    """
+    POLL_INTERVAL = 50  # мс
+
+    def __init__(self, root, max_workers: int = 2, on_busy_changed=None):
+        self.root = root
+        self.on_busy_changed = on_busy_changed
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="worker")
+        self._done = queue.Queue()
+        self._tasks = set()
+        self._polling = False
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._tasks)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, cancellable=False, **kwargs) -> Task:
+        """
+        Запускает fn(*args, **kwargs) в фоновом потоке.
+        При cancellable = True функции передаётся cancel_event для кооперативной отмены
+        """
+        cancel_event = threading.Event()
+        if cancellable:
+            kwargs["cancel_event"] = cancel_event
+        future = self._executor.submit(fn, *args, **kwargs)
+        task = Task(future, cancel_event, on_done, on_error, cancellable)
+        self._tasks.add(task)
+        future.add_done_callback(lambda _, task=task: self._done.put(task))
+        self._notify_busy()
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.POLL_INTERVAL, self._poll)
+        return task
+
+    def cancel_all(self):
+        """
+        Отменяет все незавершённые задачи
+        """
+        for task in list(self._tasks):
+            task.cancel()
+
+    def shutdown(self):
+        """
+        Останавливает пул, не дожидаясь завершения запущенных задач
+        """
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _poll(self):
+        """
+        Доставляет в поток Tk результаты завершённых задач
+        """
+        while True:
+            try:
+                task = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._tasks.discard(task)
+            self._deliver(task)
+        self._notify_busy()
+        if self._tasks:
+            self.root.after(self.POLL_INTERVAL, self._poll)
+        else:
+            self._polling = False
+
+    @staticmethod
+    def _deliver(task: Task):
+        # Результат отбрасывается, только если задача действительно отменена (CancelledError):
+        # задача, успевшая завершиться после нажатия "Отмена", уже сделала свои изменения
+        try:
+            result = task.future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            if task.on_error is not None:
+                task.on_error(e)
+            else:
+                print(f"Ошибка фоновой задачи: {e}")
+            return
+        if task.on_done is not None:
+            task.on_done(result)
+
+    def _notify_busy(self):
+        if self.on_busy_changed is not None:
+            self.on_busy_changed(len(self._tasks))